@@ -3,50 +3,85 @@ Analysis API Endpoints
 Perform optical power calculations and network analysis
 """
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, List, Optional
 import logging
 
+import numpy as np
+
+from app.core.errors import server_error
 from app.services.opm_calculator import (
     OPMCalculator,
     OpticalParameters,
     LossParameters,
     NetworkSegment,
     WavelengthType,
-    FiberType
+    FiberType,
+    STATUS_CRITICAL,
+    STATUS_LABELS,
+    STATUS_OK,
+    STATUS_WARNING
 )
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Client-facing messages for unexpected failures
+_ERRORS = {
+    "opm": "OPM calculation failed",
+    "multi": "Multi-segment analysis failed",
+    "max_distance": "Max distance calculation failed"
+}
+
+# OPMCalculator holds no per-request state, so one instance serves all requests
+_CALCULATOR = OPMCalculator()
+
+
+def get_calculator() -> OPMCalculator:
+    """Dependency providing the shared OPM calculator"""
+    return _CALCULATOR
+
+
+# Request models are immutable and reject unknown fields
+REQUEST_MODEL_CONFIG = ConfigDict(frozen=True, extra='forbid')
+
 
 class OpticalParamsRequest(BaseModel):
     """Request model for optical parameters"""
-    tx_power: float = Field(..., description="Transmit power in dBm", ge=-10, le=10)
-    rx_sensitivity: float = Field(..., description="Receiver sensitivity in dBm", ge=-40, le=-10)
-    wavelength: str = Field(default="1550nm", description="Wavelength (1310nm or 1550nm)")
-    fiber_type: str = Field(default="single_mode", description="Fiber type")
+    model_config = REQUEST_MODEL_CONFIG
+    
+    tx_power: Annotated[float, Field(description="Transmit power in dBm", ge=-10, le=10)]
+    rx_sensitivity: Annotated[float, Field(description="Receiver sensitivity in dBm", ge=-40, le=-10)]
+    wavelength: Annotated[WavelengthType, Field(description="Wavelength (1310nm or 1550nm)")] = WavelengthType.NM_1550
+    fiber_type: Annotated[FiberType, Field(description="Fiber type")] = FiberType.SINGLE_MODE
 
 
 class LossParamsRequest(BaseModel):
     """Request model for loss parameters"""
-    fiber_loss_per_km: float = Field(default=0.35, description="Fiber loss in dB/km", ge=0, le=2)
-    splice_loss: float = Field(default=0.1, description="Splice loss in dB", ge=0, le=1)
-    connector_loss: float = Field(default=0.5, description="Connector loss in dB", ge=0, le=2)
-    safety_margin: float = Field(default=3.0, description="Safety margin in dB", ge=0, le=10)
+    model_config = REQUEST_MODEL_CONFIG
+    
+    fiber_loss_per_km: Annotated[float, Field(description="Fiber loss in dB/km", ge=0, le=2)] = 0.35
+    splice_loss: Annotated[float, Field(description="Splice loss in dB", ge=0, le=1)] = 0.1
+    connector_loss: Annotated[float, Field(description="Connector loss in dB", ge=0, le=2)] = 0.5
+    safety_margin: Annotated[float, Field(description="Safety margin in dB", ge=0, le=10)] = 3.0
 
 
 class NetworkSegmentRequest(BaseModel):
     """Request model for network segment"""
-    name: str = Field(..., description="Segment name")
-    fiber_length_km: float = Field(..., description="Fiber length in kilometers", ge=0)
-    splice_count: int = Field(..., description="Number of splices", ge=0)
-    connector_count: int = Field(..., description="Number of connectors", ge=0)
+    model_config = REQUEST_MODEL_CONFIG
+    
+    name: Annotated[str, Field(description="Segment name")]
+    fiber_length_km: Annotated[float, Field(description="Fiber length in kilometers", ge=0)]
+    splice_count: Annotated[int, Field(description="Number of splices", ge=0)]
+    connector_count: Annotated[int, Field(description="Number of connectors", ge=0)]
 
 
 class OPMAnalysisRequest(BaseModel):
     """Request model for OPM analysis"""
+    model_config = REQUEST_MODEL_CONFIG
+    
     optical_params: OpticalParamsRequest
     loss_params: LossParamsRequest
     segment: NetworkSegmentRequest
@@ -54,42 +89,28 @@ class OPMAnalysisRequest(BaseModel):
 
 class MultiSegmentAnalysisRequest(BaseModel):
     """Request model for multiple segment analysis"""
+    model_config = REQUEST_MODEL_CONFIG
+    
     optical_params: OpticalParamsRequest
     loss_params: LossParamsRequest
     segments: List[NetworkSegmentRequest]
 
 
 @router.post("/opm/calculate")
-async def calculate_opm(request: OPMAnalysisRequest):
+async def calculate_opm(
+    request: OPMAnalysisRequest,
+    calculator: OPMCalculator = Depends(get_calculator)
+):
     """
     Calculate Optical Power Meter analysis for a network segment
     
     Returns power budget, loss budget, and quality assessment
     """
     try:
-        calculator = OPMCalculator()
-        
-        # Convert request models to service models
-        optical_params = OpticalParameters(
-            tx_power=request.optical_params.tx_power,
-            rx_sensitivity=request.optical_params.rx_sensitivity,
-            wavelength=WavelengthType(request.optical_params.wavelength),
-            fiber_type=FiberType(request.optical_params.fiber_type)
-        )
-        
-        loss_params = LossParameters(
-            fiber_loss_per_km=request.loss_params.fiber_loss_per_km,
-            splice_loss=request.loss_params.splice_loss,
-            connector_loss=request.loss_params.connector_loss,
-            safety_margin=request.loss_params.safety_margin
-        )
-        
-        segment = NetworkSegment(
-            name=request.segment.name,
-            fiber_length_km=request.segment.fiber_length_km,
-            splice_count=request.segment.splice_count,
-            connector_count=request.segment.connector_count
-        )
+        # Request models share field names with the service models
+        optical_params = OpticalParameters(**request.optical_params.model_dump())
+        loss_params = LossParameters(**request.loss_params.model_dump())
+        segment = NetworkSegment(**request.segment.model_dump())
         
         # Perform calculation
         result = calculator.calculate_power_budget(optical_params, loss_params, segment)
@@ -97,98 +118,125 @@ async def calculate_opm(request: OPMAnalysisRequest):
         # Get recommendations
         recommendations = calculator.get_recommendations(result)
         
+        # Round only for the response
+        rounded = result.to_dict()
+        
         return {
             "status": "success",
             "result": {
-                "power_budget_db": result.power_budget,
-                "total_loss_db": result.total_loss,
-                "available_margin_db": result.available_margin,
-                "link_status": result.status,
-                "quality_score": result.quality_score,
-                "details": result.details
+                "power_budget_db": rounded["power_budget"],
+                "total_loss_db": rounded["total_loss"],
+                "available_margin_db": rounded["available_margin"],
+                "link_status": rounded["status"],
+                "quality_score": rounded["quality_score"],
+                "details": rounded["details"]
             },
             "recommendations": recommendations
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in OPM calculation: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error performing OPM calculation: {str(e)}"
-        )
+        logger.exception("Error in OPM calculation")
+        raise server_error(_ERRORS["opm"], e)
 
 
 @router.post("/opm/multi-segment")
-async def analyze_multi_segment(request: MultiSegmentAnalysisRequest):
+async def analyze_multi_segment(
+    request: MultiSegmentAnalysisRequest,
+    compact: bool = False,
+    calculator: OPMCalculator = Depends(get_calculator)
+):
     """
     Analyze multiple network segments
     
-    Returns analysis for each segment with summary statistics
+    Returns analysis for each segment with summary statistics. With
+    compact=true, segments are returned as columns instead: segment names,
+    int status codes (indexes into status_labels) and quality scores in
+    hundredths (divide by 100), without per-segment recommendations.
     """
     try:
-        calculator = OPMCalculator()
+        optical_params = OpticalParameters(**request.optical_params.model_dump())
+        loss_params = LossParameters(**request.loss_params.model_dump())
         
-        optical_params = OpticalParameters(
-            tx_power=request.optical_params.tx_power,
-            rx_sensitivity=request.optical_params.rx_sensitivity,
-            wavelength=WavelengthType(request.optical_params.wavelength),
-            fiber_type=FiberType(request.optical_params.fiber_type)
+        # Transpose segments into columns once, then analyze in one vector pass
+        segment_count = len(request.segments)
+        lengths_km = np.fromiter(
+            (seg.fiber_length_km for seg in request.segments), dtype=np.float64, count=segment_count
+        )
+        splice_counts = np.fromiter(
+            (seg.splice_count for seg in request.segments), dtype=np.int64, count=segment_count
+        )
+        connector_counts = np.fromiter(
+            (seg.connector_count for seg in request.segments), dtype=np.int64, count=segment_count
         )
         
-        loss_params = LossParameters(
-            fiber_loss_per_km=request.loss_params.fiber_loss_per_km,
-            splice_loss=request.loss_params.splice_loss,
-            connector_loss=request.loss_params.connector_loss,
-            safety_margin=request.loss_params.safety_margin
+        batch = calculator.calculate_power_budget_batch(
+            optical_params, loss_params, lengths_km, splice_counts, connector_counts
         )
         
-        segments = [
-            NetworkSegment(
-                name=seg.name,
-                fiber_length_km=seg.fiber_length_km,
-                splice_count=seg.splice_count,
-                connector_count=seg.connector_count
-            ) for seg in request.segments
-        ]
+        # Calculate summary statistics (all three status counts in one pass)
+        ok_count, warning_count, critical_count = (
+            np.bincount(batch.status_code, minlength=3)[[STATUS_OK, STATUS_WARNING, STATUS_CRITICAL]].tolist()
+        )
+        # Averaged over the rounded per-segment scores the response reports
+        quality_scores = [round(quality, 2) for quality in batch.quality_score.tolist()]
+        avg_quality = sum(quality_scores) / segment_count if segment_count > 0 else 0
         
-        # Analyze all segments
-        results = calculator.analyze_multiple_segments(optical_params, loss_params, segments)
+        summary = {
+            "total_segments": segment_count,
+            "ok_count": ok_count,
+            "warning_count": warning_count,
+            "critical_count": critical_count,
+            "average_quality_score": round(avg_quality, 2)
+        }
         
-        # Calculate summary statistics
-        total_segments = len(results)
-        ok_count = sum(1 for r in results if r.status == "OK")
-        warning_count = sum(1 for r in results if r.status == "Warning")
-        critical_count = sum(1 for r in results if r.status == "Critical")
-        avg_quality = sum(r.quality_score for r in results) / total_segments if total_segments > 0 else 0
+        if compact:
+            return ORJSONResponse({
+                "status": "success",
+                "summary": summary,
+                "power_budget_db": round(batch.power_budget, 2),
+                "status_labels": STATUS_LABELS,
+                "segments": {
+                    "segment_name": [seg.name for seg in request.segments],
+                    "status_code": batch.status_code.tolist(),
+                    "quality_score_centi": batch.quality_score_centi.tolist()
+                }
+            })
         
-        return {
+        return ORJSONResponse({
             "status": "success",
-            "summary": {
-                "total_segments": total_segments,
-                "ok_count": ok_count,
-                "warning_count": warning_count,
-                "critical_count": critical_count,
-                "average_quality_score": round(avg_quality, 2)
-            },
+            "summary": summary,
             "segments": [
                 {
-                    "segment_name": r.details['segment_name'],
-                    "power_budget_db": r.power_budget,
-                    "total_loss_db": r.total_loss,
-                    "available_margin_db": r.available_margin,
-                    "link_status": r.status,
-                    "quality_score": r.quality_score,
-                    "recommendations": calculator.get_recommendations(r)
-                } for r in results
+                    "segment_name": seg.name,
+                    "power_budget_db": round(batch.power_budget, 2),
+                    "total_loss_db": round(total_loss, 2),
+                    "available_margin_db": round(margin, 2),
+                    "link_status": status,
+                    "quality_score": quality,
+                    # Thresholds apply to rounded values, as in get_recommendations
+                    "recommendations": calculator.build_recommendations(
+                        status_code, round(fiber_loss, 2), round(splice_loss, 2), quality
+                    )
+                } for seg, total_loss, margin, status, status_code, quality, fiber_loss, splice_loss in zip(
+                    request.segments,
+                    batch.total_loss.tolist(),
+                    batch.available_margin.tolist(),
+                    batch.status.tolist(),
+                    batch.status_code.tolist(),
+                    quality_scores,
+                    batch.fiber_loss.tolist(),
+                    batch.splice_loss.tolist()
+                )
             ]
-        }
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in multi-segment analysis: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error performing multi-segment analysis: {str(e)}"
-        )
+        logger.exception("Error in multi-segment analysis")
+        raise server_error(_ERRORS["multi"], e)
 
 
 @router.post("/opm/max-distance")
@@ -196,7 +244,8 @@ async def calculate_max_distance(
     optical_params: OpticalParamsRequest,
     loss_params: LossParamsRequest,
     splice_count: int = 0,
-    connector_count: int = 2
+    connector_count: int = 2,
+    calculator: OPMCalculator = Depends(get_calculator)
 ):
     """
     Calculate maximum allowable fiber distance
@@ -204,21 +253,8 @@ async def calculate_max_distance(
     Given optical and loss parameters, calculate the maximum distance possible
     """
     try:
-        calculator = OPMCalculator()
-        
-        optical = OpticalParameters(
-            tx_power=optical_params.tx_power,
-            rx_sensitivity=optical_params.rx_sensitivity,
-            wavelength=WavelengthType(optical_params.wavelength),
-            fiber_type=FiberType(optical_params.fiber_type)
-        )
-        
-        loss = LossParameters(
-            fiber_loss_per_km=loss_params.fiber_loss_per_km,
-            splice_loss=loss_params.splice_loss,
-            connector_loss=loss_params.connector_loss,
-            safety_margin=loss_params.safety_margin
-        )
+        optical = OpticalParameters(**optical_params.model_dump())
+        loss = LossParameters(**loss_params.model_dump())
         
         max_distance = calculator.calculate_max_distance(
             optical, loss, splice_count, connector_count
@@ -235,9 +271,8 @@ async def calculate_max_distance(
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error calculating max distance: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error calculating max distance: {str(e)}"
-        )
+        logger.exception("Error calculating max distance")
+        raise server_error(_ERRORS["max_distance"], e)
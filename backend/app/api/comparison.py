@@ -3,21 +3,153 @@ Comparison API Endpoints
 Handle As-Planned vs As-Built network comparison
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
-from typing import Optional, List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from typing import Dict, Optional, List, Tuple
+from functools import lru_cache
+import asyncio
+import hashlib
 import os
 import logging
 from pathlib import Path
 
+import numpy as np
+
 from app.core.config import settings
+from app.core.errors import server_error
 from app.services.kml_parser import KMLParser
-from app.services.csv_parser import CSVMeasurementParser
-from app.services.comparison_service import AsPlannedVsAsBuiltComparator
+from app.services.csv_parser import CSVMeasurementParser, OPMMeasurement
+from app.services.comparison_service import AsPlannedVsAsBuiltComparator, CableSoA
+from app.services.upload_storage import save_upload, upload_suffix
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Client-facing messages for unexpected failures
+_ERRORS = {
+    "asplanned": "As-Planned upload failed",
+    "asbuilt": "As-Built upload failed",
+    "compare": "Network comparison failed",
+    "projects": "Listing projects failed"
+}
+
+UPLOAD_DIR = Path(settings.UPLOAD_DIR)
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+# Accepted upload extensions (compared lowercase)
+_KML_SUFFIXES = frozenset({'.kml', '.kmz'})
+_CSV_SUFFIXES = frozenset({'.csv'})
+_PROJECT_SUFFIXES = _KML_SUFFIXES | _CSV_SUFFIXES
+
+# Parsing and comparison are CPU-bound; cap how many run in worker threads at once
+_CPU_BOUND_SEM = asyncio.Semaphore(os.cpu_count() or 4)
+
+
+async def _run_cpu_bound(func, *args):
+    """Run blocking CPU-bound work in a worker thread, at most one per CPU"""
+    async with _CPU_BOUND_SEM:
+        return await asyncio.to_thread(func, *args)
+
+
+async def _parse_optional(parse_func, file_path: Optional[str]):
+    """Run a blocking parser in a worker thread, or return None when there is no file"""
+    if file_path is None:
+        return None
+    return await _run_cpu_bound(parse_func, file_path)
+
+
+@lru_cache(maxsize=1)
+def _scan_uploads(upload_dir: Path, mtime_ns: int) -> Dict[str, Dict]:
+    """
+    Index uploaded project files in a single os.scandir pass
+    
+    Files are named "<data_type>_<project>_<original name>". Returns
+    {project: {'files': [filename, ...], 'entries': {data_type: [(filename, path), ...]}}}
+    in directory order. Cached until the upload directory's mtime changes;
+    the returned index is shared and must not be modified.
+    """
+    index = {}
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            stem, suffix = os.path.splitext(entry.name)
+            if suffix.lower() not in _PROJECT_SUFFIXES or not entry.is_file():
+                continue
+            
+            data_type, sep, rest = stem.partition('_')  # asplanned, asbuilt, opm, atp
+            if not sep:
+                continue
+            project_name = rest.partition('_')[0]
+            
+            project = index.setdefault(project_name, {'files': [], 'entries': {}})
+            project['files'].append(entry.name)
+            project['entries'].setdefault(data_type, []).append((entry.name, entry.path))
+    return index
+
+
+def _upload_index() -> Dict[str, Dict]:
+    """Current index of uploaded project files"""
+    return _scan_uploads(UPLOAD_DIR, UPLOAD_DIR.stat().st_mtime_ns)
+
+
+def _find_project_file(project_name: str, data_type: str, suffix: str) -> Optional[str]:
+    """Path of the first "<data_type>_<project_name>_*<suffix>" upload, if any"""
+    prefix = f"{data_type}_{project_name}_"
+    # Project names containing "_" are indexed under their first segment
+    project = _upload_index().get(project_name.partition('_')[0])
+    if project is None:
+        return None
+    for filename, path in project['entries'].get(data_type, []):
+        if filename.startswith(prefix) and filename.lower().endswith(suffix):
+            return path
+    return None
+
+
+def _file_version(file_path: str) -> Tuple[str, int, int]:
+    """Cache key identifying the current contents of a file"""
+    stat = os.stat(file_path)
+    return file_path, stat.st_mtime_ns, stat.st_size
+
+
+def _weak_etag(*parts) -> str:
+    """Weak ETag derived from the on-disk state a response is built from"""
+    key = '-'.join(map(str, parts)).encode()
+    return 'W/"' + hashlib.blake2b(key, digest_size=8).hexdigest() + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """True when the client's If-None-Match already names this ETag"""
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(','))
+
+
+@lru_cache(maxsize=128)
+def _parse_comparison_cables(file_path: str, mtime_ns: int, size: int) -> CableSoA:
+    """
+    Parse a KML file into the comparator's cable columns
+    
+    Cached per file version; a changed mtime or size forces a fresh parse.
+    """
+    network_data = KMLParser().parse_file(file_path)
+    return CableSoA.from_cables(network_data.cables)
+
+
+@lru_cache(maxsize=128)
+def _parse_opm_measurements(file_path: str, mtime_ns: int, size: int) -> Tuple[OPMMeasurement, ...]:
+    """Parse an OPM CSV file, cached per file version"""
+    return tuple(CSVMeasurementParser().parse_opm_csv(file_path))
+
+
+def _load_comparison_cables(file_path: str) -> CableSoA:
+    """Comparator cable data for a KML file, parsed only when the file changed"""
+    return _parse_comparison_cables(*_file_version(file_path))
+
+
+def _load_opm_measurements(file_path: str) -> Tuple[OPMMeasurement, ...]:
+    """OPM measurements for a CSV file, parsed only when the file changed"""
+    return _parse_opm_measurements(*_file_version(file_path))
+
 
 @router.post("/upload-asplanned")
 async def upload_as_planned(
@@ -28,34 +160,35 @@ async def upload_as_planned(
     Upload As-Planned KML file (design/planning data)
     """
     try:
-        if not kml_file.filename.endswith(('.kml', '.kmz')):
+        if upload_suffix(kml_file) not in _KML_SUFFIXES:
             raise HTTPException(status_code=400, detail="Only KML/KMZ files allowed")
         
         # Save with as-planned prefix
         filename = f"asplanned_{project_name}_{kml_file.filename}"
-        file_path = os.path.join(settings.UPLOAD_DIR, filename)
+        file_path = str(UPLOAD_DIR / filename)
         
-        with open(file_path, "wb") as f:
-            content = await kml_file.read()
-            f.write(content)
+        sha256 = await save_upload(kml_file, file_path)
         
         # Parse KML
         parser = KMLParser()
-        network_data = parser.parse_file(file_path)
+        network_data = await _run_cpu_bound(parser.parse_file, file_path)
         stats = parser.get_statistics()
         
         return {
             "status": "success",
             "message": "As-Planned KML uploaded successfully",
             "filename": filename,
+            "sha256": sha256,
             "project_name": project_name,
             "data_type": "as-planned",
             "statistics": stats
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error uploading As-Planned KML: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception("Error uploading As-Planned KML")
+        raise server_error(_ERRORS["asplanned"], e)
 
 
 @router.post("/upload-asbuilt")
@@ -76,73 +209,71 @@ async def upload_as_built(
             "status": "success",
             "data_type": "as-built",
             "project_name": project_name,
-            "files_uploaded": []
+            "files_uploaded": [],
+            "sha256": {}
         }
         
-        # Save and parse KML
-        if not kml_file.filename.endswith(('.kml', '.kmz')):
+        # Save KML
+        if upload_suffix(kml_file) not in _KML_SUFFIXES:
             raise HTTPException(status_code=400, detail="KML file must be .kml or .kmz")
         
         kml_filename = f"asbuilt_{project_name}_{kml_file.filename}"
-        kml_path = os.path.join(settings.UPLOAD_DIR, kml_filename)
-        
-        with open(kml_path, "wb") as f:
-            content = await kml_file.read()
-            f.write(content)
+        kml_path = str(UPLOAD_DIR / kml_filename)
         
-        parser = KMLParser()
-        network_data = parser.parse_file(kml_path)
-        stats = parser.get_statistics()
-        
-        result['kml_statistics'] = stats
+        result['sha256'][kml_filename] = await save_upload(kml_file, kml_path)
         result['files_uploaded'].append(kml_filename)
         
-        # Parse OPM CSV if provided
+        # Save OPM CSV if provided
+        opm_path = None
         if opm_csv and opm_csv.filename:
-            if not opm_csv.filename.endswith('.csv'):
+            if upload_suffix(opm_csv) not in _CSV_SUFFIXES:
                 raise HTTPException(status_code=400, detail="OPM file must be CSV")
             
             opm_filename = f"opm_{project_name}_{opm_csv.filename}"
-            opm_path = os.path.join(settings.UPLOAD_DIR, opm_filename)
-            
-            with open(opm_path, "wb") as f:
-                content = await opm_csv.read()
-                f.write(content)
+            opm_path = str(UPLOAD_DIR / opm_filename)
             
-            csv_parser = CSVMeasurementParser()
-            opm_measurements = csv_parser.parse_opm_csv(opm_path)
-            opm_summary = csv_parser.get_summary(opm_measurements)
-            
-            result['opm_summary'] = opm_summary
+            result['sha256'][opm_filename] = await save_upload(opm_csv, opm_path)
             result['files_uploaded'].append(opm_filename)
         
-        # Parse ATP CSV if provided
+        # Save ATP CSV if provided
+        atp_path = None
         if atp_csv and atp_csv.filename:
-            if not atp_csv.filename.endswith('.csv'):
+            if upload_suffix(atp_csv) not in _CSV_SUFFIXES:
                 raise HTTPException(status_code=400, detail="ATP file must be CSV")
             
             atp_filename = f"atp_{project_name}_{atp_csv.filename}"
-            atp_path = os.path.join(settings.UPLOAD_DIR, atp_filename)
-            
-            with open(atp_path, "wb") as f:
-                content = await atp_csv.read()
-                f.write(content)
+            atp_path = str(UPLOAD_DIR / atp_filename)
             
-            csv_parser = CSVMeasurementParser()
-            atp_measurements = csv_parser.parse_atp_csv(atp_path)
-            
-            result['atp_count'] = len(atp_measurements)
+            result['sha256'][atp_filename] = await save_upload(atp_csv, atp_path)
             result['files_uploaded'].append(atp_filename)
         
+        # Parse the independent files concurrently
+        parser = KMLParser()
+        csv_parser = CSVMeasurementParser()
+        network_data, opm_measurements, atp_measurements = await asyncio.gather(
+            _run_cpu_bound(parser.parse_file, kml_path),
+            _parse_optional(csv_parser.parse_opm_csv, opm_path),
+            _parse_optional(csv_parser.parse_atp_csv, atp_path)
+        )
+        
+        result['kml_statistics'] = parser.get_statistics()
+        if opm_measurements is not None:
+            result['opm_summary'] = csv_parser.get_summary(opm_measurements)
+        if atp_measurements is not None:
+            result['atp_count'] = len(atp_measurements)
+        
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error uploading As-Built data: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception("Error uploading As-Built data")
+        raise server_error(_ERRORS["asbuilt"], e)
 
 
 @router.post("/compare")
 async def compare_planned_vs_built(
+    request: Request,
     project_name: str = Form(...)
 ):
     """
@@ -150,139 +281,130 @@ async def compare_planned_vs_built(
     Returns detailed comparison analysis
     """
     try:
-        # Find files for the project
-        upload_dir = Path(settings.UPLOAD_DIR)
-        
         # Find As-Planned KML
-        planned_files = list(upload_dir.glob(f"asplanned_{project_name}_*.kml"))
-        if not planned_files:
+        planned_kml = _find_project_file(project_name, 'asplanned', '.kml')
+        if planned_kml is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"As-Planned KML not found for project: {project_name}"
             )
-        planned_kml = str(planned_files[0])
         
         # Find As-Built KML
-        built_files = list(upload_dir.glob(f"asbuilt_{project_name}_*.kml"))
-        if not built_files:
+        built_kml = _find_project_file(project_name, 'asbuilt', '.kml')
+        if built_kml is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"As-Built KML not found for project: {project_name}"
             )
-        built_kml = str(built_files[0])
-        
-        # Parse both KML files
-        parser = KMLParser()
         
-        planned_data = parser.parse_file(planned_kml)
-        planned_dict = {
-            'cables': [
-                {
-                    'name': c.name,
-                    'fiber_length_km': c.fiber_length / 1000,
-                    'construction_status': c.construction_status,
-                    'specification': c.specification
-                } for c in planned_data.cables
-            ]
-        }
+        # Find OPM measurements if available
+        opm_csv = _find_project_file(project_name, 'opm', '.csv')
         
-        built_data = parser.parse_file(built_kml)
-        built_dict = {
-            'cables': [
-                {
-                    'name': c.name,
-                    'fiber_length_km': c.fiber_length / 1000,
-                    'construction_status': c.construction_status,
-                    'specification': c.specification
-                } for c in built_data.cables
-            ]
-        }
+        # The result depends only on the three source files
+        etag = _weak_etag(
+            project_name,
+            *_file_version(planned_kml),
+            *_file_version(built_kml),
+            *(_file_version(opm_csv) if opm_csv else ())
+        )
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
         
-        # Find OPM measurements if available
-        opm_files = list(upload_dir.glob(f"opm_{project_name}_*.csv"))
-        opm_measurements = []
-        if opm_files:
-            csv_parser = CSVMeasurementParser()
-            opm_measurements = csv_parser.parse_opm_csv(str(opm_files[0]))
+        # Parse both KML files and the OPM CSV concurrently.
+        # Unchanged files are served from the parse cache.
+        planned_cables, built_cables, opm_measurements = await asyncio.gather(
+            _run_cpu_bound(_load_comparison_cables, planned_kml),
+            _run_cpu_bound(_load_comparison_cables, built_kml),
+            _parse_optional(_load_opm_measurements, opm_csv)
+        )
         
-        # Perform comparison
+        # Perform comparison off the event loop
         comparator = AsPlannedVsAsBuiltComparator()
-        comparison = comparator.compare_networks(
-            planned_dict,
-            built_dict,
+        comparison = await _run_cpu_bound(
+            comparator.compare_networks,
+            planned_cables,
+            built_cables,
             opm_measurements if opm_measurements else None
         )
         
+        # Round all cables at once on columnar copies of the results
+        comparisons = comparison.cable_comparisons
+        count = len(comparisons)
+        planned_km = np.round(np.fromiter((c.planned_length_km for c in comparisons), np.float64, count), 3)
+        built_km = np.round(np.fromiter((c.built_length_km for c in comparisons), np.float64, count), 3)
+        var_km = np.round(np.fromiter((c.length_variance_km for c in comparisons), np.float64, count), 3)
+        var_pct = np.round(np.fromiter((c.length_variance_pct for c in comparisons), np.float64, count), 2)
+        measured = np.round(np.fromiter(
+            (c.measured_loss_db or np.nan for c in comparisons), np.float64, count
+        ), 2)
+        measured_db = [None if m != m else m for m in measured.tolist()]  # NaN -> None
+        
         # Convert to JSON-serializable format
-        return {
+        return ORJSONResponse({
             "status": "success",
             "project_name": project_name,
             "summary": comparison.summary,
             "comparisons": [
                 {
                     "cable_id": c.cable_id,
-                    "planned_length_km": round(c.planned_length_km, 3),
-                    "built_length_km": round(c.built_length_km, 3),
-                    "length_variance_km": round(c.length_variance_km, 3),
-                    "length_variance_pct": round(c.length_variance_pct, 2),
+                    "planned_length_km": planned,
+                    "built_length_km": built,
+                    "length_variance_km": variance_km,
+                    "length_variance_pct": variance_pct,
                     "planned_status": c.planned_status,
                     "built_status": c.built_status,
                     "status_match": c.status_match,
-                    "measured_loss_db": round(c.measured_loss_db, 2) if c.measured_loss_db else None,
+                    "measured_loss_db": measured_loss,
                     "compliance_status": c.compliance_status,
                     "remarks": c.remarks
-                } for c in comparison.cable_comparisons
+                } for c, planned, built, variance_km, variance_pct, measured_loss in zip(
+                    comparisons,
+                    planned_km.tolist(),
+                    built_km.tolist(),
+                    var_km.tolist(),
+                    var_pct.tolist(),
+                    measured_db
+                )
             ],
             "discrepancies": comparison.discrepancies,
             "recommendations": comparison.recommendations
-        }
+        }, headers={"ETag": etag})
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error comparing networks: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception("Error comparing networks")
+        raise server_error(_ERRORS["compare"], e)
 
 
 @router.get("/projects")
-async def list_projects():
+async def list_projects(request: Request, response: Response):
     """List all projects with As-Planned/As-Built data"""
     try:
-        upload_dir = Path(settings.UPLOAD_DIR)
-        projects = {}
+        index = _upload_index()
+        etag = _weak_etag(UPLOAD_DIR.stat().st_mtime_ns, len(index))
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         
-        # Find all files and group by project
-        for file in upload_dir.glob("*"):
-            if file.is_file() and file.suffix in ['.kml', '.kmz', '.csv']:
-                parts = file.stem.split('_', 2)
-                if len(parts) >= 2:
-                    data_type = parts[0]  # asplanned, asbuilt, opm, atp
-                    project_name = parts[1]
-                    
-                    if project_name not in projects:
-                        projects[project_name] = {
-                            'name': project_name,
-                            'has_asplanned': False,
-                            'has_asbuilt': False,
-                            'has_opm': False,
-                            'has_atp': False,
-                            'files': []
-                        }
-                    
-                    projects[project_name]['files'].append(file.name)
-                    
-                    if data_type == 'asplanned':
-                        projects[project_name]['has_asplanned'] = True
-                    elif data_type == 'asbuilt':
-                        projects[project_name]['has_asbuilt'] = True
-                    elif data_type == 'opm':
-                        projects[project_name]['has_opm'] = True
-                    elif data_type == 'atp':
-                        projects[project_name]['has_atp'] = True
+        projects = [
+            {
+                'name': project_name,
+                'has_asplanned': 'asplanned' in project['entries'],
+                'has_asbuilt': 'asbuilt' in project['entries'],
+                'has_opm': 'opm' in project['entries'],
+                'has_atp': 'atp' in project['entries'],
+                'files': list(project['files'])
+            } for project_name, project in index.items()
+        ]
         
         return {
             "status": "success",
-            "projects": list(projects.values())
+            "projects": projects
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error listing projects: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception("Error listing projects")
+        raise server_error(_ERRORS["projects"], e)
@@ -4,117 +4,278 @@ Handle file uploads for KML, ABD, and OPM data
 """
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
-from typing import Optional
-import os
+from fastapi.responses import ORJSONResponse
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import logging
+import os
 from pathlib import Path
 
+import numpy as np
+
 from app.core.config import settings
-from app.services.kml_parser import KMLParser
+from app.core.errors import server_error
+from app.services.kml_parser import CableColumns, KMLParser, NetworkData
 from app.services.opm_calculator import (
     OPMCalculator,
     OpticalParameters,
     LossParameters,
-    NetworkSegment,
     WavelengthType,
     FiberType
 )
+from app.services.upload_storage import save_upload, upload_suffix
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Client-facing messages for unexpected failures
+_ERRORS = {
+    "kml": "KML processing failed",
+    "abd": "ABD upload failed",
+    "list": "Listing uploads failed"
+}
+
 # Ensure upload directory exists
-os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+UPLOAD_DIR = Path(settings.UPLOAD_DIR)
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+# Accepted upload extensions (compared lowercase)
+_KML_SUFFIXES = frozenset({'.kml', '.kmz'})
+_ABD_SUFFIXES = frozenset({'.xlsx', '.xls', '.pdf'})
+
+# Stateless calculator and frozen parameters, shared by every request
+_OPM_CALCULATOR = OPMCalculator()
+
+# Standard optical parameters (Telkom Access standard)
+_DEFAULT_OPTICAL_PARAMS = OpticalParameters(
+    tx_power=3.0,  # dBm (typical OLT)
+    rx_sensitivity=-28.0,  # dBm (typical ONT)
+    wavelength=WavelengthType.NM_1550,
+    fiber_type=FiberType.SINGLE_MODE
+)
+
+# Loss parameters based on table (Tabel 2: Loss Maksimum)
+_DEFAULT_LOSS_PARAMS = LossParameters(
+    fiber_loss_per_km=0.35,  # dB/km @ 1550nm
+    splice_loss=0.1,  # dB per splice (Max 0.1 dB)
+    connector_loss=0.25,  # dB per connector (Connector Case: 0.25 dB)
+    safety_margin=3.0  # dB
+)
+
+
+# Processed KML uploads keyed by (SHA-256 of contents, run_opm), least recent first
+_KML_CACHE: "OrderedDict[Tuple[str, bool], Dict]" = OrderedDict()
+
+
+def _coordinate_columns(coordinates: np.ndarray) -> Dict[str, List[float]]:
+    """Split an (N, 3) coordinate array into longitude/latitude/altitude lists"""
+    return {
+        "longitude": coordinates[:, 0].tolist(),
+        "latitude": coordinates[:, 1].tolist(),
+        "altitude": coordinates[:, 2].tolist()
+    }
+
+
+def _parse_kml(file_path: str) -> Tuple[NetworkData, Dict]:
+    """Parse a KML file and collect its statistics"""
+    parser = KMLParser()
+    network_data = parser.parse_file(file_path)
+    return network_data, parser.get_statistics()
+
+
+def _analyze_cables(
+    cables: CableColumns,
+    optical_params: OpticalParameters,
+    loss_params: LossParameters
+) -> Dict:
+    """Power budget analysis of every cable, computed in one vectorized pass"""
+    cable_count = len(cables)
+    lengths_m = cables.fiber_length
+    lengths_km = lengths_m / 1000  # convert m to km
+    # Estimate splice count (1 splice per 2km approximately), minimum 2 splices
+    splice_counts = np.maximum(2, (lengths_m / 2000).astype(np.int64))
+    connector_counts = np.full(cable_count, 2, dtype=np.int64)  # 1 at each end
+    
+    batch = _OPM_CALCULATOR.calculate_power_budget_batch(
+        optical_params,
+        loss_params,
+        lengths_km,
+        splice_counts,
+        connector_counts
+    )
+    power_budget = round(batch.power_budget, 2)
+    
+    opm_results = []
+    total_network_loss = 0
+    for cable_name, length_km, splices, fiber_loss, splice_loss, connector_loss, total_loss, margin, status, quality in zip(
+        cables.name.tolist(),
+        lengths_km.tolist(),
+        splice_counts.tolist(),
+        batch.fiber_loss.tolist(),
+        batch.splice_loss.tolist(),
+        batch.connector_loss.tolist(),
+        batch.total_loss.tolist(),
+        batch.available_margin.tolist(),
+        batch.status.tolist(),
+        batch.quality_score.tolist()
+    ):
+        total_loss_db = round(total_loss, 2)
+        opm_results.append({
+            "cable_name": cable_name,
+            "power_budget_db": power_budget,
+            "total_loss_db": total_loss_db,
+            "available_margin_db": round(margin, 2),
+            "status": status,
+            "quality_score": round(quality, 2),
+            "details": _OPM_CALCULATOR.build_details(
+                optical_params,
+                loss_params,
+                cable_name,
+                length_km,
+                splices,
+                2,
+                fiber_loss,
+                splice_loss,
+                connector_loss,
+                total_loss
+            ).to_dict(precision=2)
+        })
+        
+        total_network_loss += total_loss_db
+    
+    # Calculate average quality score
+    avg_quality_score = (
+        sum(r["quality_score"] for r in opm_results) / len(opm_results)
+        if opm_results else 0
+    )
+    
+    return {
+        "results": opm_results,
+        "summary": {
+            "total_segments": len(opm_results),
+            "average_quality_score": round(avg_quality_score, 2),
+            "total_network_loss_db": round(total_network_loss, 2),
+            "optical_parameters": {
+                "tx_power_dbm": optical_params.tx_power,
+                "rx_sensitivity_dbm": optical_params.rx_sensitivity,
+                "wavelength": optical_params.wavelength.value
+            },
+            "loss_standards": {
+                "fiber_loss_per_km_db": loss_params.fiber_loss_per_km,
+                "splice_loss_db": loss_params.splice_loss,
+                "connector_loss_db": loss_params.connector_loss,
+                "safety_margin_db": loss_params.safety_margin
+            }
+        }
+    }
+
+
+def _network_columns(network_data: NetworkData) -> Dict:
+    """Poles, ODPs and cables as parallel columns (one list per field)"""
+    poles = network_data.poles
+    odps = network_data.odps
+    cables = network_data.cables
+    return {
+        "poles": {
+            "name": poles.name.tolist(),
+            "designator": poles.designator.tolist(),
+            "construction_status": poles.construction_status.tolist(),
+            "material_type": poles.material_type.tolist(),
+            "usage": poles.usage.tolist(),
+            "coordinates": _coordinate_columns(poles.coordinates)
+        },
+        "odps": {
+            "name": odps.name.tolist(),
+            "specification": odps.specification.tolist(),
+            "splice_type": odps.splice_type.tolist(),
+            "construction_status": odps.construction_status.tolist(),
+            "coordinates": _coordinate_columns(odps.coordinates)
+        },
+        "cables": {
+            "name": cables.name.tolist(),
+            "specification": cables.specification.tolist(),
+            "number_of_cores": cables.number_of_cores.tolist(),
+            "fiber_length_m": cables.fiber_length.tolist(),
+            "fiber_length_km": (cables.fiber_length / 1000).tolist(),
+            "construction_status": cables.construction_status.tolist(),
+            "coordinates": [_coordinate_columns(coords) for coords in cables.coordinates]
+        }
+    }
+
+
+def _process_kml(file_path: str, run_opm: bool) -> Dict:
+    """Parse a KML file, run the OPM analysis and build the response columns"""
+    network_data, stats = _parse_kml(file_path)
+    
+    # Auto-calculate OPM analysis for each cable unless the caller opted out
+    opm_analysis = None
+    if run_opm and network_data.cables:
+        opm_analysis = _analyze_cables(
+            network_data.cables,
+            _DEFAULT_OPTICAL_PARAMS,
+            _DEFAULT_LOSS_PARAMS
+        )
+    
+    return {
+        "statistics": stats,
+        "opm_analysis": opm_analysis,
+        "data": _network_columns(network_data)
+    }
+
+
+def _cached_kml_result(key: Tuple[str, bool]) -> Optional[Dict]:
+    """Cached result for an upload key, marked as most recently used"""
+    result = _KML_CACHE.get(key)
+    if result is not None:
+        _KML_CACHE.move_to_end(key)
+    return result
+
+
+def _cache_kml_result(key: Tuple[str, bool], result: Dict) -> None:
+    """Store a result, evicting the least recently used beyond KML_CACHE_SIZE"""
+    _KML_CACHE[key] = result
+    _KML_CACHE.move_to_end(key)
+    while len(_KML_CACHE) > settings.KML_CACHE_SIZE:
+        _KML_CACHE.popitem(last=False)
 
 
 @router.post("/kml")
 async def upload_kml(
     file: UploadFile = File(...),
-    project_name: Optional[str] = Form(None)
+    project_name: Optional[str] = Form(None),
+    run_opm: bool = Form(True)
 ):
     """
     Upload and parse KML file from Google Earth
     
-    Returns parsed network infrastructure data
+    Returns parsed network infrastructure data. Poles, ODPs and cables are
+    returned column-wise: one list per field, indexed by entity. The OPM
+    analysis is skipped (opm_analysis is null) when run_opm is false or the
+    network has no cables.
     """
     try:
         # Validate file extension
-        if not file.filename.endswith(('.kml', '.kmz')):
+        if upload_suffix(file) not in _KML_SUFFIXES:
             raise HTTPException(
                 status_code=400,
                 detail="Invalid file type. Only .kml and .kmz files are allowed"
             )
         
         # Save uploaded file
-        file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        logger.info(f"Uploaded KML file: {file.filename}")
+        file_path = str(UPLOAD_DIR / file.filename)
+        digest = await save_upload(file, file_path)
         
-        # Parse KML file
-        parser = KMLParser()
-        network_data = parser.parse_file(file_path)
-        stats = parser.get_statistics()
+        logger.info("Uploaded KML file: %s", file.filename)
         
-        # Auto-calculate OPM analysis for each cable
-        opm_calculator = OPMCalculator()
-        opm_results = []
-        
-        # Standard optical parameters (Telkom Access standard)
-        optical_params = OpticalParameters(
-            tx_power=3.0,  # dBm (typical OLT)
-            rx_sensitivity=-28.0,  # dBm (typical ONT)
-            wavelength=WavelengthType.NM_1550,
-            fiber_type=FiberType.SINGLE_MODE
-        )
-        
-        # Loss parameters based on table (Tabel 2: Loss Maksimum)
-        loss_params = LossParameters(
-            fiber_loss_per_km=0.35,  # dB/km @ 1550nm
-            splice_loss=0.1,  # dB per splice (Max 0.1 dB)
-            connector_loss=0.25,  # dB per connector (Connector Case: 0.25 dB)
-            safety_margin=3.0  # dB
-        )
-        
-        # Calculate for each cable segment
-        total_network_loss = 0
-        for cable in network_data.cables:
-            # Estimate splice count (1 splice per 2km approximately)
-            estimated_splices = max(2, int(cable.fiber_length / 2000))  # minimum 2 splices
-            
-            segment = NetworkSegment(
-                fiber_length_km=cable.fiber_length / 1000,  # convert m to km
-                splice_count=estimated_splices,
-                connector_count=2,  # 1 at each end
-                name=cable.name
-            )
-            
-            result = opm_calculator.calculate_power_budget(
-                optical_params,
-                loss_params,
-                segment
-            )
-            
-            opm_results.append({
-                "cable_name": cable.name,
-                "power_budget_db": result.power_budget,
-                "total_loss_db": result.total_loss,
-                "available_margin_db": result.available_margin,
-                "status": result.status,
-                "quality_score": result.quality_score,
-                "details": result.details
-            })
-            
-            total_network_loss += result.total_loss
-        
-        # Calculate average quality score
-        avg_quality_score = (
-            sum(r["quality_score"] for r in opm_results) / len(opm_results)
-            if opm_results else 0
-        )
+        # Identical contents were already processed; reuse the shared result
+        # (read-only after caching)
+        cache_key = (digest, run_opm)
+        result = _cached_kml_result(cache_key)
+        if result is None:
+            # Parse and analyze (CPU-bound, kept off the event loop)
+            result = await asyncio.to_thread(_process_kml, file_path, run_opm)
+            _cache_kml_result(cache_key, result)
         
         # Convert to JSON-serializable format
         response_data = {
@@ -122,82 +283,16 @@ async def upload_kml(
             "message": "KML file parsed successfully",
             "filename": file.filename,
             "project_name": project_name or "Untitled Project",
-            "statistics": stats,
-            "opm_analysis": {
-                "results": opm_results,
-                "summary": {
-                    "total_segments": len(opm_results),
-                    "average_quality_score": round(avg_quality_score, 2),
-                    "total_network_loss_db": round(total_network_loss, 2),
-                    "optical_parameters": {
-                        "tx_power_dbm": optical_params.tx_power,
-                        "rx_sensitivity_dbm": optical_params.rx_sensitivity,
-                        "wavelength": optical_params.wavelength.value
-                    },
-                    "loss_standards": {
-                        "fiber_loss_per_km_db": loss_params.fiber_loss_per_km,
-                        "splice_loss_db": loss_params.splice_loss,
-                        "connector_loss_db": loss_params.connector_loss,
-                        "safety_margin_db": loss_params.safety_margin
-                    }
-                }
-            },
-            "data": {
-                "poles": [
-                    {
-                        "name": p.name,
-                        "designator": p.designator,
-                        "construction_status": p.construction_status,
-                        "material_type": p.material_type,
-                        "usage": p.usage,
-                        "coordinates": {
-                            "longitude": p.coordinates.longitude,
-                            "latitude": p.coordinates.latitude,
-                            "altitude": p.coordinates.altitude
-                        }
-                    } for p in network_data.poles
-                ],
-                "odps": [
-                    {
-                        "name": o.name,
-                        "specification": o.specification,
-                        "splice_type": o.splice_type,
-                        "construction_status": o.construction_status,
-                        "coordinates": {
-                            "longitude": o.coordinates.longitude,
-                            "latitude": o.coordinates.latitude,
-                            "altitude": o.coordinates.altitude
-                        }
-                    } for o in network_data.odps
-                ],
-                "cables": [
-                    {
-                        "name": c.name,
-                        "specification": c.specification,
-                        "number_of_cores": c.number_of_cores,
-                        "fiber_length_m": c.fiber_length,
-                        "fiber_length_km": c.fiber_length / 1000,
-                        "construction_status": c.construction_status,
-                        "coordinates": [
-                            {
-                                "longitude": coord.longitude,
-                                "latitude": coord.latitude,
-                                "altitude": coord.altitude
-                            } for coord in c.coordinates
-                        ]
-                    } for c in network_data.cables
-                ]
-            }
+            **result
         }
         
-        return JSONResponse(content=response_data)
+        return ORJSONResponse(response_data)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing KML file: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error processing KML file: {str(e)}"
-        )
+        logger.exception("Error processing KML file")
+        raise server_error(_ERRORS["kml"], e)
 
 
 @router.post("/abd")
@@ -211,18 +306,16 @@ async def upload_abd(
     Typically Excel/PDF format with network documentation
     """
     try:
-        if not any(file.filename.endswith(ext) for ext in ['.xlsx', '.xls', '.pdf']):
+        if upload_suffix(file) not in _ABD_SUFFIXES:
             raise HTTPException(
                 status_code=400,
                 detail="Invalid file type. Only .xlsx, .xls, and .pdf files are allowed"
             )
         
-        file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        file_path = str(UPLOAD_DIR / file.filename)
+        await save_upload(file, file_path)
         
-        logger.info(f"Uploaded ABD file: {file.filename}")
+        logger.info("Uploaded ABD file: %s", file.filename)
         
         return {
             "status": "success",
@@ -231,28 +324,28 @@ async def upload_abd(
             "project_name": project_name or "Untitled Project"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error uploading ABD file: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error uploading ABD file: {str(e)}"
-        )
+        logger.exception("Error uploading ABD file")
+        raise server_error(_ERRORS["abd"], e)
 
 
 @router.get("/list")
 async def list_uploads():
     """List all uploaded files"""
     try:
+        # DirEntry caches stat(), so size and mtime cost a single syscall
         files = []
-        upload_dir = Path(settings.UPLOAD_DIR)
-        
-        for file_path in upload_dir.iterdir():
-            if file_path.is_file():
-                files.append({
-                    "filename": file_path.name,
-                    "size_bytes": file_path.stat().st_size,
-                    "modified": file_path.stat().st_mtime
-                })
+        with os.scandir(UPLOAD_DIR) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files.append({
+                        "filename": entry.name,
+                        "size_bytes": stat.st_size,
+                        "modified": stat.st_mtime
+                    })
         
         return {
             "status": "success",
@@ -260,9 +353,8 @@ async def list_uploads():
             "files": files
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error listing uploads: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error listing uploads: {str(e)}"
-        )
+        logger.exception("Error listing uploads")
+        raise server_error(_ERRORS["list"], e)
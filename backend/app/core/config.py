@@ -3,9 +3,9 @@ Application Configuration
 Environment variables and settings management
 """
 
+from functools import cached_property
 from typing import List
-from pydantic_settings import BaseSettings
-from pydantic import validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
@@ -22,9 +22,9 @@ class Settings(BaseSettings):
     # CORS
     ALLOWED_ORIGINS: str = "http://localhost:3000,http://localhost:5173,http://localhost:8080"
     
-    @property
+    @cached_property
     def cors_origins(self) -> List[str]:
-        """Parse CORS origins from comma-separated string"""
+        """Parse CORS origins from comma-separated string (computed once)"""
         return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",")]
     
     # Database
@@ -34,6 +34,10 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "./uploads"
     MAX_UPLOAD_SIZE: int = 50 * 1024 * 1024  # 50MB
     ALLOWED_EXTENSIONS: List[str] = [".kml", ".kmz", ".xlsx", ".pdf"]
+    USE_IO_URING: bool = False  # Write uploads via io_uring (Linux, needs liburing)
+    KML_CACHE_SIZE: int = 32  # Processed KML uploads kept in memory, keyed by content hash
+    USE_POLARS_CSV: bool = False  # Tokenize large measurement CSVs with Polars (needs polars)
+    POLARS_CSV_MIN_SIZE: int = 8 * 1024 * 1024  # Smaller CSVs are read with pandas
     
     # Optical Calculations - Default Values
     DEFAULT_FIBER_LOSS: float = 0.35  # dB/km for 1550nm
@@ -52,9 +56,7 @@ class Settings(BaseSettings):
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "app.log"
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=True)
 
 
 # Initialize settings
@@ -0,0 +1,26 @@
+"""
+API Error Helpers
+Structured error responses that do not leak exception text
+"""
+
+from fastapi import HTTPException
+
+
+def server_error(message: str, exc: Exception) -> HTTPException:
+    """
+    Build a 500 response for an unexpected failure
+
+    Only the exception class name is exposed; the full exception is
+    expected to be logged by the caller with logger.exception.
+
+    Args:
+        message: Fixed, client-safe description of the failed operation
+        exc: The exception that was caught
+
+    Returns:
+        HTTPException with detail {"error": message, "type": exception class name}
+    """
+    return HTTPException(
+        status_code=500,
+        detail={"error": message, "type": type(exc).__name__}
+    )
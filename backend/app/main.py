@@ -3,13 +3,16 @@ Fiber Optic Network Analyzer - Main Application
 FastAPI backend for analyzing fiber optic network quality
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 import logging
 
 from app.core.config import settings
 from app.api import network, analysis, optimization, upload, comparison
+from app.services._kml_kernels import warm_up_kml_kernels
+from app.services._opm_kernels import warm_up_kernels
 
 # Configure logging
 logging.basicConfig(
@@ -18,13 +21,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup/shutdown hooks"""
+    # Compile kernels once per worker instead of on the first request
+    warm_up_kernels()
+    warm_up_kml_kernels()
+    yield
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Fiber Optic Network Analyzer",
     description="AI-powered analysis and optimization for fiber optic networks",
     version="0.1.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS Configuration
@@ -68,7 +83,7 @@ async def health_check():
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Global exception handler"""
-    logger.error(f"Unhandled exception: {exc}", exc_info=True)
+    logger.exception("Unhandled exception: %s", exc)
     return JSONResponse(
         status_code=500,
         content={
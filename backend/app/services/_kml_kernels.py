@@ -0,0 +1,115 @@
+"""
+KML Parsing Kernels
+Coordinate blob parsing compiled with Numba when it is installed
+"""
+
+import logging
+from typing import Tuple
+
+import numpy as np
+
+from app.services._opm_kernels import NUMBA_AVAILABLE, njit
+
+logger = logging.getLogger(__name__)
+
+# Powers of ten that are exact doubles (10**22 is the largest)
+_POW10 = np.array([float(10 ** i) for i in range(23)])
+
+# Largest mantissa converted exactly to a double
+_MAX_EXACT_MANTISSA = 1 << 53
+
+
+@njit(cache=True)
+def _is_space(c: int) -> bool:
+    """ASCII whitespace: space, \\t, \\n, \\v, \\f, \\r"""
+    return c == 32 or 9 <= c <= 13
+
+
+@njit(cache=True)
+def parse_coordinate_bytes(buf: np.ndarray) -> Tuple[bool, np.ndarray]:
+    """
+    Parse whitespace-separated "lon,lat[,alt]" tuples from ASCII bytes
+
+    Only plain decimals ([+-]digits[.digits]) whose digits fit in 2**53 with
+    at most 22 fraction digits are accepted. For those, mantissa / 10**k is a
+    single correctly rounded division, so every value equals float(text).
+    Anything else (exponents, inf/nan, long mantissas, empty or extra values,
+    non-ASCII) is rejected so the caller can use the general parser.
+
+    Args:
+        buf: uint8 array of the coordinate text
+
+    Returns:
+        (ok, coords) with coords an (N, 3) float64 array; a missing altitude
+        is 0.0. coords is empty when ok is False.
+    """
+    n = buf.shape[0]
+
+    # One row per whitespace-separated token
+    tokens = 0
+    in_token = False
+    for i in range(n):
+        if _is_space(buf[i]):
+            in_token = False
+        elif not in_token:
+            in_token = True
+            tokens += 1
+
+    coords = np.zeros((tokens, 3))
+    rejected = np.zeros((0, 3))
+    row = 0
+    i = 0
+    while row < tokens:
+        while _is_space(buf[i]):
+            i += 1
+
+        column = 0
+        while True:
+            negative = False
+            c = buf[i] if i < n else 0
+            if c == 43 or c == 45:  # '+' or '-'
+                negative = c == 45
+                i += 1
+
+            mantissa = 0
+            digits = 0
+            fraction_digits = 0
+            seen_point = False
+            while i < n:
+                c = buf[i]
+                if 48 <= c <= 57:
+                    mantissa = mantissa * 10 + (c - 48)
+                    if mantissa > _MAX_EXACT_MANTISSA:
+                        return False, rejected
+                    digits += 1
+                    if seen_point:
+                        fraction_digits += 1
+                elif c == 46 and not seen_point:  # '.'
+                    seen_point = True
+                else:
+                    break
+                i += 1
+
+            if digits == 0 or fraction_digits > 22 or column == 3:
+                return False, rejected
+            value = float(mantissa) / _POW10[fraction_digits]
+            coords[row, column] = -value if negative else value
+            column += 1
+
+            if i < n and buf[i] == 44:  # ',' - another value follows
+                i += 1
+                continue
+            break
+
+        if column < 2 or (i < n and not _is_space(buf[i])):
+            return False, rejected
+        row += 1
+
+    return True, coords
+
+
+def warm_up_kml_kernels() -> None:
+    """Compile (or load from cache) the coordinate kernel before serving requests"""
+    if NUMBA_AVAILABLE:
+        parse_coordinate_bytes(np.frombuffer(b"110.1,-7.2,0 110.2,-7.3", dtype=np.uint8))
+    logger.info("KML kernels ready (numba=%s)", 'enabled' if NUMBA_AVAILABLE else 'unavailable')
@@ -0,0 +1,187 @@
+"""
+OPM Calculation Kernels
+Scalar power budget math compiled with Numba when it is installed
+"""
+
+import logging
+from typing import Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import config as numba_config, njit, prange
+    NUMBA_AVAILABLE = True
+    # Parallel kernels are launched from arbitrary worker threads; OpenMP handles
+    # that cleanly, while TBB can hang at interpreter shutdown afterwards
+    numba_config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+except ImportError:  # Numba is optional - fall back to plain Python
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit that returns the function unchanged"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# Status codes returned by the kernels, indexed into STATUS_LABELS
+STATUS_CRITICAL = 0
+STATUS_WARNING = 1
+STATUS_OK = 2
+STATUS_LABELS = ("Critical", "Warning", "OK")
+
+
+@njit(cache=True)
+def power_budget_kernel(
+    tx_power: float,
+    rx_sensitivity: float,
+    fiber_loss_per_km: float,
+    splice_loss: float,
+    connector_loss: float,
+    safety_margin: float,
+    length_km: float,
+    splice_count: int,
+    connector_count: int
+) -> Tuple[float, float, float, float, float, float, float, int]:
+    """
+    Power budget for a single segment
+
+    Returns:
+        (power_budget, fiber_loss, splice_loss, connector_loss,
+         total_loss, available_margin, quality_score, status_code)
+    """
+    power_budget = tx_power - rx_sensitivity
+
+    fiber_total = length_km * fiber_loss_per_km
+    splice_total = splice_count * splice_loss
+    connector_total = connector_count * connector_loss
+    total_loss = fiber_total + splice_total + connector_total
+
+    available_margin = power_budget - total_loss - safety_margin
+
+    # OK: margin >= 3 dB, Warning: 0 dB <= margin < 3 dB, Critical: margin < 0 dB
+    if available_margin >= 3.0:
+        status_code = STATUS_OK
+    elif available_margin >= 0.0:
+        status_code = STATUS_WARNING
+    else:
+        status_code = STATUS_CRITICAL
+
+    # Quality score: loss efficiency (0-40) + margin adequacy (0-60)
+    if power_budget <= 0.0:
+        quality_score = 0.0
+    else:
+        loss_efficiency = max(0.0, 1.0 - total_loss / power_budget) * 40.0
+        margin_adequacy = min(60.0, max(0.0, (available_margin / 10.0) * 60.0))
+        quality_score = max(0.0, min(100.0, loss_efficiency + margin_adequacy))
+
+    return (
+        power_budget,
+        fiber_total,
+        splice_total,
+        connector_total,
+        total_loss,
+        available_margin,
+        quality_score,
+        status_code
+    )
+
+
+@njit(parallel=True, cache=True)
+def power_budget_batch_kernel(
+    tx_power: float,
+    rx_sensitivity: float,
+    fiber_loss_per_km: float,
+    splice_loss: float,
+    connector_loss: float,
+    safety_margin: float,
+    lengths_km: np.ndarray,
+    splice_counts: np.ndarray,
+    connector_counts: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    power_budget_kernel applied to every segment, split across CPU cores
+    
+    fastmath is left off so results match the scalar kernel bit for bit.
+    
+    Returns:
+        (fiber_loss, splice_loss, connector_loss, total_loss,
+         available_margin, quality_score, status_code) arrays
+    """
+    count = lengths_km.shape[0]
+    fiber_total = np.empty(count)
+    splice_total = np.empty(count)
+    connector_total = np.empty(count)
+    total_loss = np.empty(count)
+    available_margin = np.empty(count)
+    quality_score = np.empty(count)
+    status_code = np.empty(count, dtype=np.int8)
+    
+    for i in prange(count):
+        (
+            _,
+            fiber_total[i],
+            splice_total[i],
+            connector_total[i],
+            total_loss[i],
+            available_margin[i],
+            quality_score[i],
+            status_code[i]
+        ) = power_budget_kernel(
+            tx_power,
+            rx_sensitivity,
+            fiber_loss_per_km,
+            splice_loss,
+            connector_loss,
+            safety_margin,
+            lengths_km[i],
+            splice_counts[i],
+            connector_counts[i]
+        )
+    
+    return (
+        fiber_total,
+        splice_total,
+        connector_total,
+        total_loss,
+        available_margin,
+        quality_score,
+        status_code
+    )
+
+
+@njit(cache=True)
+def max_distance_kernel(
+    tx_power: float,
+    rx_sensitivity: float,
+    fiber_loss_per_km: float,
+    splice_loss: float,
+    connector_loss: float,
+    safety_margin: float,
+    splice_count: int,
+    connector_count: int
+) -> float:
+    """Maximum fiber distance (km) left after fixed losses and safety margin"""
+    power_budget = tx_power - rx_sensitivity
+    available_for_fiber = (
+        power_budget
+        - splice_count * splice_loss
+        - connector_count * connector_loss
+        - safety_margin
+    )
+    return max(0.0, available_for_fiber / fiber_loss_per_km)
+
+
+def warm_up_kernels() -> None:
+    """Compile (or load from cache) all kernels before serving requests"""
+    power_budget_kernel(3.0, -28.0, 0.35, 0.1, 0.5, 3.0, 1.0, 2, 2)
+    max_distance_kernel(3.0, -28.0, 0.35, 0.1, 0.5, 3.0, 2, 2)
+    if NUMBA_AVAILABLE:
+        power_budget_batch_kernel(
+            3.0, -28.0, 0.35, 0.1, 0.5, 3.0,
+            np.ones(1), np.full(1, 2, dtype=np.int64), np.full(1, 2, dtype=np.int64)
+        )
+    logger.info("OPM kernels ready (numba=%s)", 'enabled' if NUMBA_AVAILABLE else 'unavailable')
@@ -6,12 +6,18 @@ Compare planned network design with actual field implementation
 import logging
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
-import math
+
+import numpy as np
+
+from app.services.kml_parser import CableColumns
 
 logger = logging.getLogger(__name__)
 
+# Compliance statuses indexed by deviation level
+COMPLIANCE_STATUSES = ('Compliant', 'Minor Deviation', 'Major Deviation')
+
 
-@dataclass
+@dataclass(slots=True)
 class ComparisonResult:
     """Result of comparing planned vs built network"""
     cable_id: str
@@ -29,7 +35,7 @@ class ComparisonResult:
     remarks: List[str]
 
 
-@dataclass
+@dataclass(slots=True)
 class NetworkComparison:
     """Complete network comparison data"""
     cable_comparisons: List[ComparisonResult]
@@ -38,6 +44,32 @@ class NetworkComparison:
     recommendations: List[str]
 
 
+@dataclass(frozen=True)
+class CableSoA:
+    """Cable attributes stored as parallel arrays (one entry per cable)"""
+    names: np.ndarray  # str
+    lengths_km: np.ndarray  # float64
+    statuses: np.ndarray  # str
+    statuses_lower: np.ndarray  # str, lowercased once for case-insensitive matching
+    specs: np.ndarray  # str
+    
+    def __post_init__(self):
+        # Instances are cached and shared between requests
+        for column in (self.names, self.lengths_km, self.statuses, self.statuses_lower, self.specs):
+            column.flags.writeable = False
+    
+    @classmethod
+    def from_cables(cls, cables: CableColumns) -> "CableSoA":
+        """Build cable columns from parsed KML cables"""
+        return cls(
+            names=cables.name,
+            lengths_km=cables.fiber_length / 1000.0,
+            statuses=cables.construction_status,
+            statuses_lower=np.array([s.lower() for s in cables.construction_status.tolist()], dtype=object),
+            specs=cables.specification
+        )
+
+
 class AsPlannedVsAsBuiltComparator:
     """Compare As-Planned (KML) with As-Built (KML + CSV) data"""
     
@@ -50,16 +82,16 @@ class AsPlannedVsAsBuiltComparator:
     
     def compare_networks(
         self,
-        planned_data: Dict,
-        built_data: Dict,
+        planned_data: CableSoA,
+        built_data: CableSoA,
         opm_measurements: Optional[List] = None
     ) -> NetworkComparison:
         """
         Compare planned network with as-built data
         
         Args:
-            planned_data: Parsed KML data (As-Planned)
-            built_data: Parsed KML data (As-Built)
+            planned_data: Cable columns from the As-Planned KML
+            built_data: Cable columns from the As-Built KML
             opm_measurements: OPM measurement results (optional)
             
         Returns:
@@ -68,9 +100,9 @@ class AsPlannedVsAsBuiltComparator:
         try:
             cable_comparisons = []
             
-            # Create cable lookup dictionaries
-            planned_cables = {c['name']: c for c in planned_data.get('cables', [])}
-            built_cables = {c['name']: c for c in built_data.get('cables', [])}
+            # Map cable name -> row (the last row wins for duplicate names)
+            planned_rows = {name: i for i, name in enumerate(planned_data.names.tolist())}
+            built_rows = {name: i for i, name in enumerate(built_data.names.tolist())}
             
             # Create OPM measurement lookup if available
             opm_lookup = {}
@@ -78,33 +110,81 @@ class AsPlannedVsAsBuiltComparator:
                 for m in opm_measurements:
                     opm_lookup[m.cable_id] = m
             
+            # Align each planned cable with its built counterpart (-1 = not built)
+            planned_count = len(planned_rows)
+            planned_idx = np.fromiter(planned_rows.values(), dtype=np.intp, count=planned_count)
+            built_idx = np.fromiter(
+                (built_rows.get(name, -1) for name in planned_rows), dtype=np.intp, count=planned_count
+            )
+            is_built = built_idx >= 0
+            
+            planned_lengths = planned_data.lengths_km[planned_idx]
+            built_lengths = np.zeros(planned_count)
+            built_lengths[is_built] = built_data.lengths_km[built_idx[is_built]]
+            
+            # Calculate variances for all planned cables at once
+            length_variance_km = built_lengths - planned_lengths
+            with np.errstate(divide='ignore', invalid='ignore'):
+                length_variance_pct = np.where(
+                    planned_lengths > 0, length_variance_km / planned_lengths * 100, 0.0
+                )
+            length_variance_pct[~is_built] = -100.0
+            
+            # Case-insensitive status comparison on the pre-lowercased columns
+            status_match = np.zeros(planned_count, dtype=bool)
+            status_match[is_built] = (
+                planned_data.statuses_lower[planned_idx[is_built]]
+                == built_data.statuses_lower[built_idx[is_built]]
+            )
+            
             # Compare each planned cable
-            for cable_name, planned_cable in planned_cables.items():
-                built_cable = built_cables.get(cable_name)
-                opm_data = opm_lookup.get(cable_name)
+            for k, cable_name in enumerate(planned_rows):
+                planned_status = planned_data.statuses[planned_idx[k]]
                 
-                comparison = self._compare_cable(
+                if not is_built[k]:
+                    comparison = self._create_unbuilt_cable_result(
+                        cable_name,
+                        float(planned_lengths[k]),
+                        planned_status
+                    )
+                else:
+                    comparison = self._compare_cable(
+                        cable_name,
+                        float(planned_lengths[k]),
+                        planned_status,
+                        float(built_lengths[k]),
+                        built_data.statuses[built_idx[k]],
+                        float(length_variance_km[k]),
+                        float(length_variance_pct[k]),
+                        bool(status_match[k]),
+                        opm_lookup.get(cable_name)
+                    )
+                cable_comparisons.append(comparison)
+            
+            # Check for cables in built but not in planned (kept in built order)
+            unplanned_rows = np.fromiter(
+                (row for name, row in built_rows.items() if name not in planned_rows),
+                dtype=np.intp
+            )
+            for row in unplanned_rows.tolist():
+                cable_name = built_data.names[row]
+                comparison = self._create_unplanned_cable_result(
                     cable_name,
-                    planned_cable,
-                    built_cable,
-                    opm_data
+                    float(built_data.lengths_km[row]),
+                    built_data.statuses[row],
+                    opm_lookup.get(cable_name)
                 )
                 cable_comparisons.append(comparison)
             
-            # Check for cables in built but not in planned
-            for cable_name in built_cables:
-                if cable_name not in planned_cables:
-                    comparison = self._create_unplanned_cable_result(
-                        cable_name,
-                        built_cables[cable_name],
-                        opm_lookup.get(cable_name)
-                    )
-                    cable_comparisons.append(comparison)
+            # Network length totals straight from the length columns
+            total_planned_length = float(planned_lengths.sum())
+            total_built_length = float(built_lengths.sum() + built_data.lengths_km[unplanned_rows].sum())
             
             # Generate summary and recommendations
-            summary = self._generate_summary(cable_comparisons)
-            discrepancies = self._identify_discrepancies(cable_comparisons)
-            recommendations = self._generate_recommendations(cable_comparisons, summary)
+            summary, discrepancies, not_built, unplanned_count = self._aggregate(
+                cable_comparisons, total_planned_length, total_built_length
+            )
+            recommendations = self._generate_recommendations(summary, not_built, unplanned_count)
             
             return NetworkComparison(
                 cable_comparisons=cable_comparisons,
@@ -114,68 +194,45 @@ class AsPlannedVsAsBuiltComparator:
             )
             
         except Exception as e:
-            logger.error(f"Error comparing networks: {e}")
+            logger.error("Error comparing networks: %s", e)
             raise
     
     def _compare_cable(
         self,
         cable_name: str,
-        planned: Dict,
-        built: Optional[Dict],
+        planned_length: float,
+        planned_status: str,
+        built_length: float,
+        built_status: str,
+        length_variance_km: float,
+        length_variance_pct: float,
+        status_match: bool,
         opm: Optional[any]
     ) -> ComparisonResult:
         """Compare single cable planned vs built"""
-        
-        planned_length = planned.get('fiber_length_km', 0)
-        planned_status = planned.get('construction_status', 'Unknown')
         planned_loss = None  # Can be calculated from planned parameters
         
-        if not built:
-            # Cable planned but not built
-            return ComparisonResult(
-                cable_id=cable_name,
-                planned_length_km=planned_length,
-                built_length_km=0,
-                length_variance_km=-planned_length,
-                length_variance_pct=-100.0,
-                planned_status=planned_status,
-                built_status='Not Built',
-                status_match=False,
-                planned_loss_db=planned_loss,
-                measured_loss_db=None,
-                loss_variance_db=None,
-                compliance_status='Major Deviation',
-                remarks=['Cable planned but not built']
-            )
-        
-        built_length = built.get('fiber_length_km', 0)
-        built_status = built.get('construction_status', 'Unknown')
-        
-        # Calculate variances
-        length_variance_km = built_length - planned_length
-        length_variance_pct = (length_variance_km / planned_length * 100) if planned_length > 0 else 0
-        
-        status_match = planned_status.lower() == built_status.lower()
-        
         # OPM data comparison
         measured_loss = opm.loss_db if opm else None
         loss_variance = None
         
         remarks = []
         
-        # Determine compliance status
-        if abs(length_variance_pct) <= self.LENGTH_TOLERANCE_PCT:
-            if measured_loss is None or (planned_loss and abs(measured_loss - planned_loss) <= self.LOSS_TOLERANCE_DB):
-                compliance_status = 'Compliant'
-            else:
-                compliance_status = 'Minor Deviation'
+        # Determine compliance status: 0 within tolerance, 1 within twice the
+        # tolerance, 2 beyond (NaN counts as beyond, hence "not <=")
+        tolerance = self.LENGTH_TOLERANCE_PCT
+        abs_variance = -length_variance_pct if length_variance_pct < 0 else length_variance_pct
+        deviation = (not abs_variance <= tolerance) + (not abs_variance <= tolerance * 2)
+        
+        if deviation == 0:
+            if not (measured_loss is None or (planned_loss and abs(measured_loss - planned_loss) <= self.LOSS_TOLERANCE_DB)):
+                deviation = 1
                 remarks.append(f'Loss variance detected')
-        elif abs(length_variance_pct) <= self.LENGTH_TOLERANCE_PCT * 2:
-            compliance_status = 'Minor Deviation'
+        elif deviation == 1:
             remarks.append(f'Length variance: {length_variance_pct:.1f}%')
         else:
-            compliance_status = 'Major Deviation'
             remarks.append(f'Significant length variance: {length_variance_pct:.1f}%')
+        compliance_status = COMPLIANCE_STATUSES[deviation]
         
         if not status_match:
             remarks.append(f'Status mismatch: {planned_status} → {built_status}')
@@ -196,15 +253,37 @@ class AsPlannedVsAsBuiltComparator:
             remarks=remarks
         )
     
+    def _create_unbuilt_cable_result(
+        self,
+        cable_name: str,
+        planned_length: float,
+        planned_status: str
+    ) -> ComparisonResult:
+        """Create result for cable planned but not built"""
+        return ComparisonResult(
+            cable_id=cable_name,
+            planned_length_km=planned_length,
+            built_length_km=0,
+            length_variance_km=-planned_length,
+            length_variance_pct=-100.0,
+            planned_status=planned_status,
+            built_status='Not Built',
+            status_match=False,
+            planned_loss_db=None,
+            measured_loss_db=None,
+            loss_variance_db=None,
+            compliance_status='Major Deviation',
+            remarks=['Cable planned but not built']
+        )
+    
     def _create_unplanned_cable_result(
         self,
         cable_name: str,
-        built: Dict,
+        built_length: float,
+        built_status: str,
         opm: Optional[any]
     ) -> ComparisonResult:
         """Create result for cable built but not planned"""
-        built_length = built.get('fiber_length_km', 0)
-        built_status = built.get('construction_status', 'Unknown')
         measured_loss = opm.loss_db if opm else None
         
         return ComparisonResult(
@@ -223,51 +302,67 @@ class AsPlannedVsAsBuiltComparator:
             remarks=['Cable built but not in original plan']
         )
     
-    def _generate_summary(self, comparisons: List[ComparisonResult]) -> Dict:
-        """Generate summary statistics"""
-        total = len(comparisons)
-        if total == 0:
-            return {}
+    def _aggregate(
+        self,
+        comparisons: List[ComparisonResult],
+        total_planned_length: float,
+        total_built_length: float
+    ) -> Tuple[Dict, List[Dict], int, int]:
+        """
+        Collect summary statistics and discrepancies in a single pass
+        
+        Args:
+            comparisons: Per-cable comparison results
+            total_planned_length: Sum of planned lengths (km)
+            total_built_length: Sum of built lengths (km)
+            
+        Returns:
+            (summary, discrepancies, not_built_count, unplanned_count)
+        """
+        compliant = 0
+        not_built = unplanned = 0
+        # Discrepancies partitioned by severity (majors first) instead of sorted
+        majors = []
+        minors = []
         
-        compliant = sum(1 for c in comparisons if c.compliance_status == 'Compliant')
-        minor_dev = sum(1 for c in comparisons if c.compliance_status == 'Minor Deviation')
-        major_dev = sum(1 for c in comparisons if c.compliance_status == 'Major Deviation')
+        for comp in comparisons:
+            status = comp.compliance_status
+            if status == 'Compliant':
+                compliant += 1
+            else:
+                bucket = majors if status == 'Major Deviation' else minors
+                bucket.append({
+                    'cable_id': comp.cable_id,
+                    'severity': status,
+                    'length_variance_pct': comp.length_variance_pct,
+                    'remarks': comp.remarks
+                })
+            
+            if comp.built_status == 'Not Built':
+                not_built += 1
+            if comp.planned_status == 'Not Planned':
+                unplanned += 1
+        
+        discrepancies = majors + minors
         
-        total_planned_length = sum(c.planned_length_km for c in comparisons)
-        total_built_length = sum(c.built_length_km for c in comparisons)
+        total = len(comparisons)
+        if total == 0:
+            return {}, discrepancies, not_built, unplanned
         
-        return {
+        summary = {
             'total_cables': total,
             'compliant': compliant,
-            'minor_deviations': minor_dev,
-            'major_deviations': major_dev,
+            'minor_deviations': len(minors),
+            'major_deviations': len(majors),
             'compliance_rate': round(compliant / total * 100, 2),
             'total_planned_length_km': round(total_planned_length, 2),
             'total_built_length_km': round(total_built_length, 2),
             'overall_length_variance_km': round(total_built_length - total_planned_length, 2),
             'overall_length_variance_pct': round((total_built_length - total_planned_length) / total_planned_length * 100, 2) if total_planned_length > 0 else 0
         }
+        return summary, discrepancies, not_built, unplanned
     
-    def _identify_discrepancies(self, comparisons: List[ComparisonResult]) -> List[Dict]:
-        """Identify significant discrepancies"""
-        discrepancies = []
-        
-        for comp in comparisons:
-            if comp.compliance_status in ['Minor Deviation', 'Major Deviation']:
-                discrepancies.append({
-                    'cable_id': comp.cable_id,
-                    'severity': comp.compliance_status,
-                    'length_variance_pct': comp.length_variance_pct,
-                    'remarks': comp.remarks
-                })
-        
-        # Sort by severity
-        severity_order = {'Major Deviation': 0, 'Minor Deviation': 1}
-        discrepancies.sort(key=lambda x: severity_order.get(x['severity'], 2))
-        
-        return discrepancies
-    
-    def _generate_recommendations(self, comparisons: List[ComparisonResult], summary: Dict) -> List[str]:
+    def _generate_recommendations(self, summary: Dict, not_built: int, unplanned: int) -> List[str]:
         """Generate recommendations based on comparison"""
         recommendations = []
         
@@ -287,12 +382,10 @@ class AsPlannedVsAsBuiltComparator:
             recommendations.append('⚠️ Review: Multiple compliance issues detected')
         
         # Specific recommendations
-        not_built = [c for c in comparisons if c.built_status == 'Not Built']
         if not_built:
-            recommendations.append(f'📋 {len(not_built)} planned cables not yet built')
+            recommendations.append(f'📋 {not_built} planned cables not yet built')
         
-        unplanned = [c for c in comparisons if c.planned_status == 'Not Planned']
         if unplanned:
-            recommendations.append(f'📋 {len(unplanned)} unplanned cables built - update design documentation')
+            recommendations.append(f'📋 {unplanned} unplanned cables built - update design documentation')
         
         return recommendations
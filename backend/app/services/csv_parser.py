@@ -4,16 +4,52 @@ Parse field measurement results (As-Built data)
 """
 
 import logging
-import csv
-from typing import Dict, List, Optional
+import os
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 import re
 
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+
+try:
+    import polars as pl
+except ImportError:  # polars is optional - CSVs are read with pandas
+    pl = None
+
 logger = logging.getLogger(__name__)
 
+if settings.USE_POLARS_CSV and pl is None:
+    logger.warning("USE_POLARS_CSV is set but polars is not installed; using pandas")
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+def _float_or_none(text: str) -> Optional[float]:
+    """float(text), or None when it does not parse"""
+    try:
+        return float(text)
+    except ValueError:
+        return None
 
-@dataclass
+
+def _int_or_none(text: str) -> Optional[int]:
+    """int(text), or None when it does not parse or does not fit in int64"""
+    try:
+        value = int(text)
+    except ValueError:
+        return None
+    return value if _INT64_MIN <= value <= _INT64_MAX else None
+
+
+@dataclass(slots=True)
 class OPMMeasurement:
     """OPM (Optical Power Meter) measurement result"""
     cable_id: str
@@ -29,7 +65,7 @@ class OPMMeasurement:
     measured_by: Optional[str]
 
 
-@dataclass
+@dataclass(slots=True)
 class ATPMeasurement:
     """ATP (Acceptance Test Procedure) result"""
     odp_id: str
@@ -41,7 +77,7 @@ class ATPMeasurement:
     remarks: Optional[str]
 
 
-@dataclass
+@dataclass(slots=True)
 class MeasurementData:
     """Complete measurement data from CSV"""
     opm_measurements: List[OPMMeasurement]
@@ -52,6 +88,39 @@ class MeasurementData:
 class CSVMeasurementParser:
     """Parser for OPM/ATP measurement CSV files"""
     
+    # Field -> (accepted column names in lookup order, default when all are empty)
+    OPM_COLUMNS = {
+        'cable_id': (('Cable ID', 'CableID', 'Cable_ID', 'cable_id'), ''),
+        'segment_name': (('Segment', 'Segment Name', 'segment'), ''),
+        'measurement_date': (('Date', 'Measurement Date', 'date'), ''),
+        'tx_power_dbm': (('Tx Power (dBm)', 'Tx Power', 'tx_power'), '0'),
+        'rx_power_dbm': (('Rx Power (dBm)', 'Rx Power', 'rx_power'), '0'),
+        'loss_db': (('Loss (dB)', 'Loss', 'loss'), '0'),
+        'length_km': (('Length (km)', 'Length', 'length'), '0'),
+        'wavelength_nm': (('Wavelength (nm)', 'Wavelength', 'wavelength'), '1550'),
+        'status': (('Status', 'Test Status', 'status'), 'Unknown'),
+        'remarks': (('Remarks', 'Notes', 'remarks'), ''),
+        'measured_by': (('Measured By', 'Technician', 'measured_by'), '')
+    }
+    
+    OPM_FLOAT_FIELDS = ('tx_power_dbm', 'rx_power_dbm', 'loss_db', 'length_km')
+    
+    # Low-cardinality text fields (same date/status/technician across a batch);
+    # equal values are interned so rows share one string object
+    OPM_INTERNED_FIELDS = ('measurement_date', 'status', 'measured_by')
+    
+    ATP_COLUMNS = {
+        'odp_id': (('ODP ID', 'ODP_ID', 'odp_id'), ''),
+        'test_date': (('Test Date', 'Date', 'test_date'), ''),
+        'optical_loss_db': (('Optical Loss (dB)', 'Loss', 'optical_loss'), '0'),
+        'reflectance_db': (('Reflectance (dB)', 'Reflectance', 'reflectance'), ''),
+        'test_result': (('Test Result', 'Result', 'test_result'), 'Unknown'),
+        'fiber_core': (('Fiber Core', 'Core', 'fiber_core'), '1'),
+        'remarks': (('Remarks', 'Notes', 'remarks'), '')
+    }
+    
+    ATP_INTERNED_FIELDS = ('test_date', 'test_result')
+    
     def __init__(self):
         self.opm_measurements: List[OPMMeasurement] = []
         self.atp_measurements: List[ATPMeasurement] = []
@@ -63,39 +132,29 @@ class CSVMeasurementParser:
         Expected columns:
         Cable ID, Segment, Date, Tx Power (dBm), Rx Power (dBm), 
         Loss (dB), Length (km), Wavelength (nm), Status, Remarks, Measured By
+        
+        Rows with a non-numeric power, loss, length or wavelength are skipped;
+        text that float() reads as NaN (e.g. "nan") is kept as NaN.
         """
         try:
-            measurements = []
+            columns = self._read_columns(file_path, self.OPM_COLUMNS, self.OPM_FLOAT_FIELDS + ('wavelength_nm',))
+            failed = np.zeros(len(columns['cable_id']), dtype=bool)
+            for field in self.OPM_FLOAT_FIELDS:
+                columns[field], field_failed = self._to_float(columns[field])
+                failed |= field_failed
+            columns['wavelength_nm'], field_failed = self._to_int(columns['wavelength_nm'])
+            failed |= field_failed
             
-            with open(file_path, 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                
-                for row in reader:
-                    try:
-                        # Parse with flexible column names
-                        measurement = OPMMeasurement(
-                            cable_id=self._get_value(row, ['Cable ID', 'CableID', 'Cable_ID', 'cable_id']),
-                            segment_name=self._get_value(row, ['Segment', 'Segment Name', 'segment']),
-                            measurement_date=self._get_value(row, ['Date', 'Measurement Date', 'date']),
-                            tx_power_dbm=float(self._get_value(row, ['Tx Power (dBm)', 'Tx Power', 'tx_power'], '0')),
-                            rx_power_dbm=float(self._get_value(row, ['Rx Power (dBm)', 'Rx Power', 'rx_power'], '0')),
-                            loss_db=float(self._get_value(row, ['Loss (dB)', 'Loss', 'loss'], '0')),
-                            length_km=float(self._get_value(row, ['Length (km)', 'Length', 'length'], '0')),
-                            wavelength_nm=int(self._get_value(row, ['Wavelength (nm)', 'Wavelength', 'wavelength'], '1550')),
-                            status=self._get_value(row, ['Status', 'Test Status', 'status'], 'Unknown'),
-                            remarks=self._get_value(row, ['Remarks', 'Notes', 'remarks']),
-                            measured_by=self._get_value(row, ['Measured By', 'Technician', 'measured_by'])
-                        )
-                        measurements.append(measurement)
-                    except (ValueError, KeyError) as e:
-                        logger.warning(f"Error parsing row: {e}")
-                        continue
+            measurements = [
+                OPMMeasurement(*row)
+                for row in self._valid_rows(columns, failed, self.OPM_INTERNED_FIELDS, 'OPM')
+            ]
             
-            logger.info(f"Parsed {len(measurements)} OPM measurements")
+            logger.info("Parsed %s OPM measurements", len(measurements))
             return measurements
             
         except Exception as e:
-            logger.error(f"Error parsing OPM CSV: {e}")
+            logger.error("Error parsing OPM CSV: %s", e)
             raise
     
     def parse_atp_csv(self, file_path: str) -> List[ATPMeasurement]:
@@ -105,49 +164,172 @@ class CSVMeasurementParser:
         Expected columns:
         ODP ID, Test Date, Optical Loss (dB), Reflectance (dB), 
         Test Result, Fiber Core, Remarks
+        
+        Rows with a non-numeric optical loss or fiber core are skipped; an
+        empty or non-numeric reflectance becomes None. Text that float()
+        reads as NaN (e.g. "nan") is kept as NaN.
         """
         try:
-            measurements = []
+            columns = self._read_columns(file_path, self.ATP_COLUMNS, ('optical_loss_db', 'reflectance_db', 'fiber_core'))
+            columns['optical_loss_db'], loss_failed = self._to_float(columns['optical_loss_db'])
+            columns['fiber_core'], core_failed = self._to_int(columns['fiber_core'])
+            reflectance, reflectance_failed = self._to_float(columns['reflectance_db'])
+            columns['reflectance_db'] = reflectance.astype(object).where(~reflectance_failed, None)
             
-            with open(file_path, 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                
-                for row in reader:
-                    try:
-                        measurement = ATPMeasurement(
-                            odp_id=self._get_value(row, ['ODP ID', 'ODP_ID', 'odp_id']),
-                            test_date=self._get_value(row, ['Test Date', 'Date', 'test_date']),
-                            optical_loss_db=float(self._get_value(row, ['Optical Loss (dB)', 'Loss', 'optical_loss'], '0')),
-                            reflectance_db=self._parse_float(self._get_value(row, ['Reflectance (dB)', 'Reflectance', 'reflectance'])),
-                            test_result=self._get_value(row, ['Test Result', 'Result', 'test_result'], 'Unknown'),
-                            fiber_core=int(self._get_value(row, ['Fiber Core', 'Core', 'fiber_core'], '1')),
-                            remarks=self._get_value(row, ['Remarks', 'Notes', 'remarks'])
-                        )
-                        measurements.append(measurement)
-                    except (ValueError, KeyError) as e:
-                        logger.warning(f"Error parsing ATP row: {e}")
-                        continue
+            measurements = [
+                ATPMeasurement(*row)
+                for row in self._valid_rows(columns, loss_failed | core_failed, self.ATP_INTERNED_FIELDS, 'ATP')
+            ]
             
-            logger.info(f"Parsed {len(measurements)} ATP measurements")
+            logger.info("Parsed %s ATP measurements", len(measurements))
             return measurements
             
         except Exception as e:
-            logger.error(f"Error parsing ATP CSV: {e}")
+            logger.error("Error parsing ATP CSV: %s", e)
             raise
     
-    def _get_value(self, row: Dict, possible_keys: List[str], default: str = "") -> str:
-        """Get value from row with flexible key matching"""
-        for key in possible_keys:
-            if key in row and row[key]:
-                return row[key].strip()
-        return default
+    def parse_opm_csv_batch(self, file_paths: List[str], max_workers: Optional[int] = None) -> List[List[OPMMeasurement]]:
+        """Parse several OPM CSV files in parallel worker processes, in the order given"""
+        return self._parse_batch(self.parse_opm_csv, file_paths, max_workers)
     
-    def _parse_float(self, value: str) -> Optional[float]:
-        """Parse float with error handling"""
+    def parse_atp_csv_batch(self, file_paths: List[str], max_workers: Optional[int] = None) -> List[List[ATPMeasurement]]:
+        """Parse several ATP CSV files in parallel worker processes, in the order given"""
+        return self._parse_batch(self.parse_atp_csv, file_paths, max_workers)
+    
+    def _parse_batch(self, parse, file_paths: List[str], max_workers: Optional[int]) -> List[list]:
+        """Map a parse method over files, one worker process per file (inline for a single file)"""
+        if len(file_paths) <= 1:
+            return [parse(path) for path in file_paths]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(parse, file_paths))
+    
+    def _read_columns(
+        self,
+        file_path: str,
+        fields: Dict[str, Tuple[Tuple[str, ...], str]],
+        numeric_fields: Tuple[str, ...] = ()
+    ) -> Dict[str, pd.Series]:
+        """
+        Read a CSV file and resolve each field from its accepted column names
+        
+        Every cell is read as text. For each row a field takes the stripped
+        value of the first listed column that is non-empty, else its default.
+        Numeric fields are left unstripped, since float()/int() ignore
+        surrounding whitespace anyway. Extra cells beyond the header are
+        dropped (the row is kept), as csv.DictReader does.
+        """
+        df = self._read_frame(file_path)
+        
+        columns = {}
+        for field, (keys, default) in fields.items():
+            values = pd.Series(default, index=df.index, dtype=object)
+            for key in reversed(keys):
+                if key in df.columns:
+                    raw = df[key].fillna('')
+                    text = raw if field in numeric_fields else raw.str.strip()
+                    values = text.where(raw != '', values)
+            columns[field] = values
+        return columns
+    
+    def _read_frame(self, file_path: str) -> pd.DataFrame:
+        """
+        Read a CSV file as text cells
+        
+        With settings.USE_POLARS_CSV, files of at least POLARS_CSV_MIN_SIZE
+        bytes are tokenized by Polars on all cores. Blank lines, which Polars
+        reads as all-null rows, are dropped; rows whose cells are all empty
+        are dropped with them. Files Polars rejects (e.g. lines with more
+        cells than the header) are read again with pandas.
+        """
+        if (
+            settings.USE_POLARS_CSV and pl is not None
+            and os.path.getsize(file_path) >= settings.POLARS_CSV_MIN_SIZE
+        ):
+            try:
+                frame = pl.read_csv(file_path, infer_schema=False).filter(~pl.all_horizontal(pl.all().is_null()))
+                return pd.DataFrame(
+                    {name: frame.get_column(name).fill_null('').to_numpy() for name in frame.columns},
+                    dtype=str
+                )
+            except pl.exceptions.PolarsError as e:
+                logger.warning("Polars could not read %s (%s); reading with pandas", file_path, e)
+        
+        options = dict(encoding='utf-8-sig', dtype=str, keep_default_na=False, index_col=False)
+        try:
+            return pd.read_csv(file_path, **options)
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame()
+        except pd.errors.ParserError:
+            pass
+        
+        # Slow path for lines with more cells than the header: the python
+        # engine can keep those rows with the extra cells dropped
+        header_size = len(pd.read_csv(file_path, nrows=0, **options).columns)
+        truncated = []
+        
+        def truncate(cells: List[str]) -> List[str]:
+            truncated.append(len(cells))
+            return cells[:header_size]
+        
+        with warnings.catch_warnings():
+            # Reported below instead (with a count)
+            warnings.simplefilter('ignore', pd.errors.ParserWarning)
+            frame = pd.read_csv(file_path, engine='python', on_bad_lines=truncate, **options)
+        if truncated:
+            logger.warning(
+                "Dropped extra cells from %s rows of %s (header has %s columns)",
+                len(truncated), file_path, header_size
+            )
+        return frame
+    
+    def _to_float(self, values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+        """
+        Convert text to float64 exactly as float() does
+        
+        Returns the values and a mask of the ones that did not parse (those
+        become NaN). Text float() reads as NaN is not counted as a failure.
+        """
+        text = values.to_numpy(dtype=object)
+        try:
+            # One C-level pass; falls back per value only when some text is invalid
+            parsed = np.asarray(text, dtype=np.float64)
+            failed = np.zeros(len(text), dtype=bool)
+        except ValueError:
+            floats = list(map(_float_or_none, text))
+            failed = np.fromiter((value is None for value in floats), dtype=bool, count=len(text))
+            parsed = np.array(floats, dtype=np.float64)  # None -> NaN
+        return pd.Series(parsed, index=values.index), failed
+    
+    def _to_int(self, values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+        """
+        Convert text to nullable Int64 exactly as int() does
+        
+        Returns the values and a mask of the ones that did not parse or do
+        not fit in int64 (those become <NA>).
+        """
+        text = values.to_numpy(dtype=object)
         try:
-            return float(value) if value else None
-        except:
-            return None
+            parsed = pd.array(np.asarray(text, dtype=np.int64), dtype='Int64')
+        except (ValueError, OverflowError):
+            parsed = pd.array(list(map(_int_or_none, text)), dtype='Int64')
+        return pd.Series(parsed, index=values.index), parsed.isna()
+    
+    def _valid_rows(
+        self,
+        columns: Dict[str, pd.Series],
+        failed: np.ndarray,
+        interned_fields: Tuple[str, ...],
+        label: str
+    ):
+        """Rows (as tuples in field order) not marked in the failed mask"""
+        valid = ~failed
+        skipped = int(valid.size - np.count_nonzero(valid))
+        if skipped:
+            logger.warning("Skipped %s %s rows with non-numeric values", skipped, label)
+        return zip(*(
+            list(map(sys.intern, col[valid].tolist())) if field in interned_fields else col[valid].tolist()
+            for field, col in columns.items()
+        ))
     
     def get_summary(self, measurements: List[OPMMeasurement]) -> Dict:
         """Generate summary statistics for OPM measurements"""
@@ -155,12 +337,16 @@ class CSVMeasurementParser:
             return {}
         
         total = len(measurements)
-        passed = sum(1 for m in measurements if m.status.lower() == 'pass')
-        failed = sum(1 for m in measurements if m.status.lower() == 'fail')
-        warning = sum(1 for m in measurements if m.status.lower() == 'warning')
+        statuses = np.char.lower(np.array([m.status for m in measurements], dtype=str))
+        passed = int(np.count_nonzero(statuses == 'pass'))
+        failed = int(np.count_nonzero(statuses == 'fail'))
+        warning = int(np.count_nonzero(statuses == 'warning'))
         
-        avg_loss = sum(m.loss_db for m in measurements) / total
-        avg_length = sum(m.length_km for m in measurements) / total
+        loss = np.fromiter((m.loss_db for m in measurements), dtype=np.float64, count=total)
+        length = np.fromiter((m.length_km for m in measurements), dtype=np.float64, count=total)
+        avg_loss = float(loss.mean())
+        total_length = float(length.sum())
+        avg_length = total_length / total
         
         return {
             'total_measurements': total,
@@ -170,5 +356,5 @@ class CSVMeasurementParser:
             'pass_rate': round(passed / total * 100, 2) if total > 0 else 0,
             'average_loss_db': round(avg_loss, 2),
             'average_length_km': round(avg_length, 2),
-            'total_length_km': round(sum(m.length_km for m in measurements), 2)
+            'total_length_km': round(total_length, 2)
         }
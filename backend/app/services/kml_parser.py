@@ -4,61 +4,126 @@ Parse Google Earth KML files and extract network infrastructure data
 """
 
 import logging
-from typing import Dict, List, Optional, Tuple
-from xml.etree import ElementTree as ET
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+from lxml import etree
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
+from itertools import repeat
+import math
+import mmap
+import os
 import re
 
+import numpy as np
+
+from app.services._kml_kernels import NUMBA_AVAILABLE, parse_coordinate_bytes
+
 logger = logging.getLogger(__name__)
 
 
-@dataclass
-class Coordinate:
-    """Geographic coordinate"""
-    longitude: float
-    latitude: float
-    altitude: float = 0.0
+def _transpose(rows: List[tuple], width: int) -> List[list]:
+    """Per-field lists from parsed rows"""
+    return [list(column) for column in zip(*rows)] if rows else [[] for _ in range(width)]
+
 
+@contextmanager
+def _mapped_file(file_path: str) -> Iterator[Union[mmap.mmap, BinaryIO]]:
+    """Read-only memory map of a file (the open file itself when it is empty)"""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:  # empty files cannot be mapped
+            yield f
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
 
-@dataclass
-class Pole:
-    """Tiang (Utility Pole)"""
-    name: str
-    designator: str
-    construction_status: str
-    material_type: str
-    usage: str
-    coordinates: Coordinate
+
+@dataclass(slots=True)
+class PoleColumns:
+    """Tiang (Utility Pole) data stored as parallel columns (one entry per pole)"""
+    name: np.ndarray  # str
+    designator: np.ndarray  # str
+    construction_status: np.ndarray  # str
+    material_type: np.ndarray  # str
+    usage: np.ndarray  # str
+    coordinates: np.ndarray  # (N, 3) float64 rows of longitude, latitude, altitude
+    
+    def __len__(self) -> int:
+        return len(self.name)
+    
+    @classmethod
+    def from_rows(cls, rows: List[tuple]) -> "PoleColumns":
+        """Build columns from (name, designator, status, material, usage, coordinate) rows"""
+        name, designator, status, material, usage, coordinates = _transpose(rows, 6)
+        return cls(
+            name=np.array(name, dtype=object),
+            designator=np.array(designator, dtype=object),
+            construction_status=np.array(status, dtype=object),
+            material_type=np.array(material, dtype=object),
+            usage=np.array(usage, dtype=object),
+            coordinates=np.array(coordinates, dtype=np.float64).reshape(-1, 3)
+        )
 
 
-@dataclass
-class ODP:
-    """Optical Distribution Point"""
-    name: str
-    specification: str
-    splice_type: str
-    construction_status: str
-    coordinates: Coordinate
+@dataclass(slots=True)
+class ODPColumns:
+    """Optical Distribution Point data stored as parallel columns (one entry per ODP)"""
+    name: np.ndarray  # str
+    specification: np.ndarray  # str
+    splice_type: np.ndarray  # str
+    construction_status: np.ndarray  # str
+    coordinates: np.ndarray  # (N, 3) float64 rows of longitude, latitude, altitude
+    
+    def __len__(self) -> int:
+        return len(self.name)
+    
+    @classmethod
+    def from_rows(cls, rows: List[tuple]) -> "ODPColumns":
+        """Build columns from (name, specification, splice type, status, coordinate) rows"""
+        name, specification, splice_type, status, coordinates = _transpose(rows, 5)
+        return cls(
+            name=np.array(name, dtype=object),
+            specification=np.array(specification, dtype=object),
+            splice_type=np.array(splice_type, dtype=object),
+            construction_status=np.array(status, dtype=object),
+            coordinates=np.array(coordinates, dtype=np.float64).reshape(-1, 3)
+        )
 
 
-@dataclass
-class Cable:
-    """Fiber Optic Cable"""
-    name: str
-    specification: str
-    number_of_cores: int
-    fiber_length: float  # meters
-    construction_status: str
-    coordinates: List[Coordinate]  # LineString
+@dataclass(slots=True)
+class CableColumns:
+    """Fiber Optic Cable data stored as parallel columns (one entry per cable)"""
+    name: np.ndarray  # str
+    specification: np.ndarray  # str
+    number_of_cores: np.ndarray  # int64
+    fiber_length: np.ndarray  # float64, meters
+    construction_status: np.ndarray  # str
+    coordinates: List[np.ndarray]  # LineString per cable, (K, 3) float64 rows of lon, lat, alt
+    
+    def __len__(self) -> int:
+        return len(self.name)
+    
+    @classmethod
+    def from_rows(cls, rows: List[tuple]) -> "CableColumns":
+        """Build columns from (name, specification, cores, length, status, coordinates) rows"""
+        name, specification, cores, length, status, coordinates = _transpose(rows, 6)
+        return cls(
+            name=np.array(name, dtype=object),
+            specification=np.array(specification, dtype=object),
+            number_of_cores=np.array(cores, dtype=np.int64),
+            fiber_length=np.array(length, dtype=np.float64),
+            construction_status=np.array(status, dtype=object),
+            coordinates=coordinates
+        )
 
 
-@dataclass
+@dataclass(slots=True)
 class NetworkData:
     """Complete network data from KML"""
-    poles: List[Pole]
-    odps: List[ODP]
-    cables: List[Cable]
-    raw_placemarks: List[Dict]
+    poles: PoleColumns
+    odps: ODPColumns
+    cables: CableColumns
+    raw_placemarks: List[Dict]  # empty unless parsed with store_raw=True
 
 
 class KMLParser:
@@ -70,10 +135,44 @@ class KMLParser:
         'gx': 'http://www.google.com/kml/ext/2.2'
     }
     
-    def __init__(self):
-        self.poles: List[Pole] = []
-        self.odps: List[ODP] = []
-        self.cables: List[Cable] = []
+    # "Field Name: value" pairs in a description, case-insensitive. The match
+    # is a lookahead so one finditer pass reports overlapping pairs too; each
+    # field keeps its first occurrence, as a per-field re.search would.
+    FIELD_PATTERN = re.compile(
+        r'(?=(Designator|Construction Status|Material Type|Usage|Specification ID|'
+        r'Specification|Splice Type|Number of Core|Fiber Length)\s*:\s*([^\n]+))',
+        re.IGNORECASE
+    )
+    
+    # Substrings of the lowercased name or description marking each type,
+    # in precedence order (a placemark matching several is the first type)
+    TYPE_INDICATORS = {
+        'pole': ('tiang', 'pole', 'PU-', 'designator:pu'),
+        'odp': ('odp', 'optical distribution', 'splice'),
+        'cable': ('cable', 'kabel', 'fiber length', 'number of core', 'adss')
+    }
+    INDICATOR_TYPES = {ind: placemark_type for placemark_type, inds in TYPE_INDICATORS.items() for ind in inds}
+    # No indicator is a prefix of another, so the lookahead reports every occurrence
+    INDICATOR_PATTERN = re.compile('(?=(' + '|'.join(map(re.escape, INDICATOR_TYPES)) + '))')
+    
+    # Coordinate blobs made only of "lon,lat,alt" (or only "lon,lat") tuples
+    COORDS_3D_PATTERN = re.compile(r'\s*[^\s,]+,[^\s,]+,[^\s,]+(?:\s+[^\s,]+,[^\s,]+,[^\s,]+)*\s*')
+    COORDS_2D_PATTERN = re.compile(r'\s*[^\s,]+,[^\s,]+(?:\s+[^\s,]+,[^\s,]+)*\s*')
+    
+    def __init__(self, store_raw: bool = False):
+        """
+        Args:
+            store_raw: Also keep name, description and type of every placemark
+                in raw_placemarks (off by default to save memory)
+        """
+        self.store_raw = store_raw
+        # Rows are collected while streaming, then transposed into columns once
+        self._pole_rows: List[tuple] = []
+        self._odp_rows: List[tuple] = []
+        self._cable_rows: List[tuple] = []
+        self.poles = PoleColumns.from_rows([])
+        self.odps = ODPColumns.from_rows([])
+        self.cables = CableColumns.from_rows([])
         self.raw_placemarks: List[Dict] = []
     
     def parse_file(self, file_path: str) -> NetworkData:
@@ -87,17 +186,33 @@ class KMLParser:
             NetworkData object containing all parsed elements
         """
         try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            
-            # Find all Placemark elements
-            placemarks = root.findall('.//kml:Placemark', self.NS)
-            logger.info(f"Found {len(placemarks)} placemarks in KML")
+            # Stream Placemark elements instead of building the whole tree,
+            # freeing each one (and its processed siblings) once parsed. The
+            # file is memory-mapped so it is read without intermediate copies.
+            placemark_count = 0
+            with _mapped_file(file_path) as source:
+                placemarks = etree.iterparse(
+                    source,
+                    events=('end',),
+                    tag=f"{{{self.NS['kml']}}}Placemark",
+                    resolve_entities=False
+                )
+                
+                for _, placemark in placemarks:
+                    self._parse_placemark(placemark)
+                    placemark_count += 1
+                    
+                    placemark.clear(keep_tail=True)
+                    parent = placemark.getparent()
+                    while placemark.getprevious() is not None:
+                        del parent[0]
             
-            for placemark in placemarks:
-                self._parse_placemark(placemark)
+            logger.info("Found %s placemarks in KML", placemark_count)
             
-            logger.info(f"Parsed: {len(self.poles)} poles, {len(self.odps)} ODPs, {len(self.cables)} cables")
+            self.poles = PoleColumns.from_rows(self._pole_rows)
+            self.odps = ODPColumns.from_rows(self._odp_rows)
+            self.cables = CableColumns.from_rows(self._cable_rows)
+            logger.info("Parsed: %s poles, %s ODPs, %s cables", len(self.poles), len(self.odps), len(self.cables))
             
             return NetworkData(
                 poles=self.poles,
@@ -107,159 +222,168 @@ class KMLParser:
             )
             
         except Exception as e:
-            logger.error(f"Error parsing KML file: {e}")
+            logger.error("Error parsing KML file: %s", e)
             raise
     
-    def _parse_placemark(self, placemark: ET.Element) -> None:
-        """Parse individual Placemark element"""
-        try:
-            name_elem = placemark.find('kml:name', self.NS)
-            name = name_elem.text if name_elem is not None else "Unknown"
-            
-            desc_elem = placemark.find('kml:description', self.NS)
-            description = desc_elem.text if desc_elem is not None else ""
-            
-            # Determine type and parse accordingly
-            if self._is_pole(name, description):
-                pole = self._parse_pole(placemark, name, description)
-                if pole:
-                    self.poles.append(pole)
-                    
-            elif self._is_odp(name, description):
-                odp = self._parse_odp(placemark, name, description)
-                if odp:
-                    self.odps.append(odp)
-                    
-            elif self._is_cable(name, description):
-                cable = self._parse_cable(placemark, name, description)
-                if cable:
-                    self.cables.append(cable)
+    @classmethod
+    def parse_files(
+        cls,
+        file_paths: List[str],
+        store_raw: bool = False,
+        max_workers: Optional[int] = None
+    ) -> List[NetworkData]:
+        """
+        Parse several KML files in parallel, one worker process per file
+        
+        Each file gets a fresh parser, so results never share state.
+        
+        Args:
+            file_paths: Paths to KML files
+            store_raw: Passed to each file's parser
+            max_workers: Worker processes (default: one per CPU)
             
-            # Store raw data
+        Returns:
+            NetworkData for each file, in the order given
+        """
+        if len(file_paths) <= 1:
+            return [_parse_kml_file(path, store_raw) for path in file_paths]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(_parse_kml_file, file_paths, repeat(store_raw)))
+    
+    def _parse_placemark(self, placemark: etree._Element) -> None:
+        """Parse individual Placemark element"""
+        name_elem = placemark.find('kml:name', self.NS)
+        name = name_elem.text if name_elem is not None else "Unknown"
+        
+        desc_elem = placemark.find('kml:description', self.NS)
+        description = desc_elem.text if desc_elem is not None else ""
+        
+        # Present but empty elements have no text
+        if name is None or description is None:
+            logger.warning("Skipping placemark with an empty name or description")
+            return
+        
+        # Determine type, then look up only the geometry that type uses
+        placemark_type = self._classify(name, description)
+        if placemark_type == 'pole' or placemark_type == 'odp':
+            geometry = placemark.find('.//kml:Point/kml:coordinates', self.NS)
+        elif placemark_type == 'cable':
+            # Cables are LineStrings
+            geometry = placemark.find('.//kml:LineString/kml:coordinates', self.NS)
+        else:
+            geometry = None
+        
+        if geometry is not None:
+            coords = self._parse_coordinates(geometry.text)
+            if len(coords) > 0:
+                if placemark_type == 'pole':
+                    self._pole_rows.append(self._parse_pole(name, description, coords))
+                elif placemark_type == 'odp':
+                    self._odp_rows.append(self._parse_odp(name, description, coords))
+                else:
+                    cable = self._parse_cable(name, description, coords)
+                    if cable:
+                        self._cable_rows.append(cable)
+        
+        # Store raw data
+        if self.store_raw:
             self.raw_placemarks.append({
                 'name': name,
                 'description': description,
-                'type': self._determine_type(name, description)
+                'type': placemark_type
             })
-            
-        except Exception as e:
-            logger.warning(f"Error parsing placemark: {e}")
-    
-    def _is_pole(self, name: str, description: str) -> bool:
-        """Check if placemark is a pole/tiang"""
-        pole_indicators = ['tiang', 'pole', 'PU-', 'designator:pu']
-        name_lower = name.lower()
-        desc_lower = description.lower()
-        return any(ind in name_lower or ind in desc_lower for ind in pole_indicators)
-    
-    def _is_odp(self, name: str, description: str) -> bool:
-        """Check if placemark is an ODP"""
-        odp_indicators = ['odp', 'optical distribution', 'splice']
-        name_lower = name.lower()
-        desc_lower = description.lower()
-        return any(ind in name_lower or ind in desc_lower for ind in odp_indicators)
     
-    def _is_cable(self, name: str, description: str) -> bool:
-        """Check if placemark is a cable"""
-        cable_indicators = ['cable', 'kabel', 'fiber length', 'number of core', 'adss']
-        name_lower = name.lower()
-        desc_lower = description.lower()
-        return any(ind in name_lower or ind in desc_lower for ind in cable_indicators)
+    def _classify(self, name: str, description: str) -> str:
+        """Determine infrastructure type ('pole', 'odp', 'cable' or 'unknown') in one scan"""
+        text = (name + '\n' + description).lower()
+        found = {self.INDICATOR_TYPES[match.group(1)] for match in self.INDICATOR_PATTERN.finditer(text)}
+        for placemark_type in self.TYPE_INDICATORS:
+            if placemark_type in found:
+                return placemark_type
+        return 'unknown'
     
-    def _parse_pole(self, placemark: ET.Element, name: str, description: str) -> Optional[Pole]:
-        """Parse pole/tiang data"""
-        try:
-            # Extract coordinates
-            point = placemark.find('.//kml:Point/kml:coordinates', self.NS)
-            if point is None:
-                return None
-            
-            coords = self._parse_coordinates(point.text)
-            if not coords:
-                return None
-            
-            # Parse description fields
-            designator = self._extract_field(description, 'Designator')
-            construction_status = self._extract_field(description, 'Construction Status')
-            material_type = self._extract_field(description, 'Material Type')
-            usage = self._extract_field(description, 'Usage')
-            
-            return Pole(
-                name=name,
-                designator=designator or name,
-                construction_status=construction_status or 'Unknown',
-                material_type=material_type or 'Unknown',
-                usage=usage or 'Telco',
-                coordinates=coords[0]
-            )
-        except Exception as e:
-            logger.warning(f"Error parsing pole {name}: {e}")
-            return None
+    def _parse_pole(self, name: str, description: str, coords: np.ndarray) -> tuple:
+        """Parse pole/tiang data into a PoleColumns row"""
+        # Parse description fields
+        fields = self._extract_fields(description)
+        designator = fields.get('designator')
+        construction_status = fields.get('construction status')
+        material_type = fields.get('material type')
+        usage = fields.get('usage')
+        
+        return (
+            name,
+            designator or name,
+            construction_status or 'Unknown',
+            material_type or 'Unknown',
+            usage or 'Telco',
+            coords[0]
+        )
     
-    def _parse_odp(self, placemark: ET.Element, name: str, description: str) -> Optional[ODP]:
-        """Parse ODP data"""
-        try:
-            point = placemark.find('.//kml:Point/kml:coordinates', self.NS)
-            if point is None:
-                return None
-            
-            coords = self._parse_coordinates(point.text)
-            if not coords:
-                return None
-            
-            specification = self._extract_field(description, 'Specification ID')
-            splice_type = self._extract_field(description, 'Splice Type')
-            construction_status = self._extract_field(description, 'Construction Status')
-            
-            return ODP(
-                name=name,
-                specification=specification or 'Unknown',
-                splice_type=splice_type or 'Unknown',
-                construction_status=construction_status or 'Unknown',
-                coordinates=coords[0]
-            )
-        except Exception as e:
-            logger.warning(f"Error parsing ODP {name}: {e}")
-            return None
+    def _parse_odp(self, name: str, description: str, coords: np.ndarray) -> tuple:
+        """Parse ODP data into an ODPColumns row"""
+        fields = self._extract_fields(description)
+        specification = fields.get('specification id')
+        splice_type = fields.get('splice type')
+        construction_status = fields.get('construction status')
+        
+        return (
+            name,
+            specification or 'Unknown',
+            splice_type or 'Unknown',
+            construction_status or 'Unknown',
+            coords[0]
+        )
     
-    def _parse_cable(self, placemark: ET.Element, name: str, description: str) -> Optional[Cable]:
-        """Parse cable data"""
+    def _parse_cable(self, name: str, description: str, coords: np.ndarray) -> Optional[tuple]:
+        """Parse cable data into a CableColumns row"""
+        fields = self._extract_fields(description)
+        specification = fields.get('specification')
+        cores_str = fields.get('number of core')
+        length_str = fields.get('fiber length')
+        construction_status = fields.get('construction status')
+        
+        # Parse numeric values
         try:
-            # Cables are LineStrings
-            linestring = placemark.find('.//kml:LineString/kml:coordinates', self.NS)
-            if linestring is None:
-                return None
-            
-            coords = self._parse_coordinates(linestring.text)
-            if not coords:
-                return None
-            
-            specification = self._extract_field(description, 'Specification')
-            cores_str = self._extract_field(description, 'Number of Core')
-            length_str = self._extract_field(description, 'Fiber Length')
-            construction_status = self._extract_field(description, 'Construction Status')
-            
-            # Parse numeric values
+            # isdigit() also accepts digits int() rejects, e.g. superscripts
             cores = int(cores_str) if cores_str and cores_str.isdigit() else 0
-            length = self._parse_length(length_str) if length_str else 0.0
-            
-            return Cable(
-                name=name,
-                specification=specification or 'Unknown',
-                number_of_cores=cores,
-                fiber_length=length,
-                construction_status=construction_status or 'Unknown',
-                coordinates=coords
-            )
-        except Exception as e:
-            logger.warning(f"Error parsing cable {name}: {e}")
+        except ValueError as e:
+            logger.warning("Error parsing cable %s: %s", name, e)
             return None
+        length = self._parse_length(length_str) if length_str else 0.0
+        
+        return (
+            name,
+            specification or 'Unknown',
+            cores,
+            length,
+            construction_status or 'Unknown',
+            coords
+        )
     
-    def _parse_coordinates(self, coord_text: str) -> List[Coordinate]:
-        """Parse coordinate string to Coordinate objects"""
+    def _parse_coordinates(self, coord_text: str) -> np.ndarray:
+        """Parse coordinate string to an (N, 3) array of longitude, latitude, altitude"""
         if not coord_text:
-            return []
+            return np.empty((0, 3))
+        
+        # Plain decimal tuples (the normal case) parse in one compiled pass
+        if NUMBA_AVAILABLE:
+            ok, coords = parse_coordinate_bytes(np.frombuffer(coord_text.encode(), dtype=np.uint8))
+            if ok:
+                return coords
+        
+        # Uniform tuples convert in a single NumPy call
+        for pattern, width in ((self.COORDS_3D_PATTERN, 3), (self.COORDS_2D_PATTERN, 2)):
+            if pattern.fullmatch(coord_text):
+                try:
+                    values = np.array(coord_text.replace(',', ' ').split(), dtype=np.float64)
+                except ValueError:
+                    break
+                coords = np.zeros((values.size // width, 3))
+                coords[:, :width] = values.reshape(-1, width)
+                return coords
         
+        # Mixed or malformed tuples: parse one by one, skipping bad ones
         coords = []
         # Split by whitespace and newlines
         coord_parts = coord_text.strip().split()
@@ -271,51 +395,51 @@ class KMLParser:
                     lon = float(values[0])
                     lat = float(values[1])
                     alt = float(values[2]) if len(values) > 2 else 0.0
-                    coords.append(Coordinate(lon, lat, alt))
+                    coords.append((lon, lat, alt))
             except (ValueError, IndexError):
                 continue
         
-        return coords
+        return np.array(coords, dtype=np.float64).reshape(-1, 3)
     
-    def _extract_field(self, description: str, field_name: str) -> Optional[str]:
-        """Extract field value from description text"""
+    def _extract_fields(self, description: str) -> Dict[str, str]:
+        """Extract all known field values from description text, keyed by lowercase field name"""
         # Match pattern like "Field Name: Value" or "Field Name:Value"
-        pattern = rf'{field_name}\s*:\s*([^\n]+)'
-        match = re.search(pattern, description, re.IGNORECASE)
-        if match:
-            return match.group(1).strip()
-        return None
+        fields = {}
+        for match in self.FIELD_PATTERN.finditer(description):
+            fields.setdefault(match.group(1).lower(), match.group(2).strip())
+        return fields
     
     def _parse_length(self, length_str: str) -> float:
         """Parse length string (e.g., '123m', '1.5km')"""
         try:
             # Remove 'm' or 'meter' and convert
             length_str = length_str.lower().replace('meter', '').replace('m', '').strip()
+            # Whole metres (e.g. '123m') skip the float parser; up to 15
+            # digits int -> float is exact, so the result is unchanged
+            if length_str.isdigit() and len(length_str) <= 15:
+                return float(int(length_str))
             if 'km' in length_str:
                 length_str = length_str.replace('km', '').strip()
                 return float(length_str) * 1000
             return float(length_str)
-        except:
+        except ValueError:
             return 0.0
     
-    def _determine_type(self, name: str, description: str) -> str:
-        """Determine infrastructure type"""
-        if self._is_pole(name, description):
-            return 'pole'
-        elif self._is_odp(name, description):
-            return 'odp'
-        elif self._is_cable(name, description):
-            return 'cable'
-        return 'unknown'
-    
     def get_statistics(self) -> Dict:
         """Get parsing statistics"""
+        pole_status = np.char.lower(self.poles.construction_status.astype(str))
+        total_cable_length_m = math.fsum(self.cables.fiber_length)
         return {
             'total_poles': len(self.poles),
             'total_odps': len(self.odps),
             'total_cables': len(self.cables),
-            'poles_in_service': len([p for p in self.poles if 'service' in p.construction_status.lower()]),
-            'poles_planned': len([p for p in self.poles if 'planned' in p.construction_status.lower()]),
-            'total_cable_length_m': sum(c.fiber_length for c in self.cables),
-            'total_cable_length_km': sum(c.fiber_length for c in self.cables) / 1000,
+            'poles_in_service': int(np.count_nonzero(np.char.find(pole_status, 'service') >= 0)),
+            'poles_planned': int(np.count_nonzero(np.char.find(pole_status, 'planned') >= 0)),
+            'total_cable_length_m': total_cable_length_m,
+            'total_cable_length_km': total_cable_length_m / 1000,
         }
+
+
+def _parse_kml_file(file_path: str, store_raw: bool) -> NetworkData:
+    """Parse one KML file with a fresh parser (KMLParser.parse_files worker)"""
+    return KMLParser(store_raw).parse_file(file_path)
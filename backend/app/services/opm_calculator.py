@@ -4,11 +4,25 @@ Calculate power budget, loss budget, and signal quality for fiber optic networks
 """
 
 import logging
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
 import math
 
+import numpy as np
+
+from app.services._opm_kernels import (
+    NUMBA_AVAILABLE,
+    STATUS_CRITICAL,
+    STATUS_LABELS,
+    STATUS_OK,
+    STATUS_WARNING,
+    max_distance_kernel,
+    power_budget_batch_kernel,
+    power_budget_kernel
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,7 +38,7 @@ class FiberType(str, Enum):
     MULTI_MODE = "multi_mode"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class OpticalParameters:
     """Optical transmission parameters"""
     tx_power: float  # Transmit power (dBm)
@@ -33,33 +47,205 @@ class OpticalParameters:
     fiber_type: FiberType = FiberType.SINGLE_MODE
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class NetworkSegment:
     """Network segment for loss calculation"""
     fiber_length_km: float
     splice_count: int
     connector_count: int
     name: str = "Segment"
+    
+    @staticmethod
+    def stack(segments: List["NetworkSegment"]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
+        """Transpose segments into (lengths_km float64, splice_counts int64, connector_counts int64, names)"""
+        count = len(segments)
+        return (
+            np.fromiter((seg.fiber_length_km for seg in segments), dtype=np.float64, count=count),
+            np.fromiter((seg.splice_count for seg in segments), dtype=np.int64, count=count),
+            np.fromiter((seg.connector_count for seg in segments), dtype=np.int64, count=count),
+            [seg.name for seg in segments]
+        )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class LossParameters:
     """Loss parameters for calculation"""
     fiber_loss_per_km: float = 0.35  # dB/km at 1550nm
     splice_loss: float = 0.1  # dB per splice
     connector_loss: float = 0.5  # dB per connector
     safety_margin: float = 3.0  # dB
+    
+    @classmethod
+    def for_wavelength(cls, wavelength: WavelengthType, **overrides: float) -> "LossParameters":
+        """Loss parameters using the standard fiber loss for a wavelength (other values as given or default)"""
+        return cls(fiber_loss_per_km=OPMCalculator.STANDARD_LOSS_VALUES[wavelength], **overrides)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
+class OPMDetails:
+    """Flat detailed result for one segment (nested only by to_dict)"""
+    segment_name: str
+    tx_power_dbm: float
+    rx_sensitivity_dbm: float
+    wavelength: str
+    fiber_type: str
+    fiber_loss_db: float
+    splice_loss_db: float
+    connector_loss_db: float
+    total_loss_db: float
+    fiber_length_km: float
+    splice_count: int
+    connector_count: int
+    safety_margin_db: float
+    loss_per_km_db: float
+    
+    def to_dict(self, precision: Optional[int] = None) -> Dict:
+        """Nested details dictionary as returned by the API, loss values rounded if a precision is given"""
+        fiber_loss = self.fiber_loss_db
+        splice_loss = self.splice_loss_db
+        connector_loss = self.connector_loss_db
+        total_loss = self.total_loss_db
+        if precision is not None:
+            fiber_loss = round(fiber_loss, precision)
+            splice_loss = round(splice_loss, precision)
+            connector_loss = round(connector_loss, precision)
+            total_loss = round(total_loss, precision)
+        
+        return {
+            'segment_name': self.segment_name,
+            'optical_params': {
+                'tx_power_dbm': self.tx_power_dbm,
+                'rx_sensitivity_dbm': self.rx_sensitivity_dbm,
+                'wavelength': self.wavelength,
+                'fiber_type': self.fiber_type
+            },
+            'loss_breakdown': {
+                'fiber_loss_db': fiber_loss,
+                'splice_loss_db': splice_loss,
+                'connector_loss_db': connector_loss,
+                'total_loss_db': total_loss
+            },
+            'segment_details': {
+                'fiber_length_km': self.fiber_length_km,
+                'fiber_length_m': self.fiber_length_km * 1000,
+                'splice_count': self.splice_count,
+                'connector_count': self.connector_count
+            },
+            'safety_margin_db': self.safety_margin_db,
+            'loss_per_km_db': self.loss_per_km_db
+        }
+
+
+@dataclass(slots=True, frozen=True)
 class CalculationResult:
-    """OPM calculation result"""
+    """OPM calculation result (full precision; rounded by to_dict)"""
     power_budget: float  # dB
     total_loss: float  # dB
     available_margin: float  # dB
     status: str  # "OK", "Warning", "Critical"
+    status_code: int  # index into STATUS_LABELS
     quality_score: float  # 0-100
-    details: Dict
+    # Inputs and loss components kept to build details on demand
+    optical_params: OpticalParameters
+    loss_params: LossParameters
+    segment: NetworkSegment
+    fiber_loss: float  # dB
+    splice_loss: float  # dB
+    connector_loss: float  # dB
+    # details cache slot (cached_property needs an instance __dict__)
+    _details: Optional[OPMDetails] = field(default=None, init=False, repr=False, compare=False)
+    
+    @property
+    def details(self) -> OPMDetails:
+        """Detailed results, built on first access"""
+        details = self._details
+        if details is None:
+            segment = self.segment
+            details = OPMCalculator.build_details(
+                self.optical_params,
+                self.loss_params,
+                segment.name,
+                segment.fiber_length_km,
+                segment.splice_count,
+                segment.connector_count,
+                self.fiber_loss,
+                self.splice_loss,
+                self.connector_loss,
+                self.total_loss
+            )
+            object.__setattr__(self, '_details', details)
+        return details
+    
+    def to_dict(self, precision: int = 2) -> Dict:
+        """Result as a dict with dB values and quality score rounded for serialization"""
+        details = self.details.to_dict(precision)
+        return {
+            'power_budget': round(self.power_budget, precision),
+            'total_loss': round(self.total_loss, precision),
+            'available_margin': round(self.available_margin, precision),
+            'status': self.status,
+            'quality_score': round(self.quality_score, precision),
+            'details': details
+        }
+
+
+@dataclass
+class BatchCalculationResult:
+    """Columnar OPM calculation result for many segments"""
+    power_budget: float  # dB
+    fiber_loss: np.ndarray  # dB
+    splice_loss: np.ndarray  # dB
+    connector_loss: np.ndarray  # dB
+    total_loss: np.ndarray  # dB
+    available_margin: np.ndarray  # dB
+    status_code: np.ndarray  # int8 index into STATUS_LABELS
+    status: np.ndarray  # "OK", "Warning", "Critical"
+    quality_score: np.ndarray  # 0-100
+    
+    @property
+    def quality_score_centi(self) -> np.ndarray:
+        """Quality scores in hundredths as int16 (0-10000), for compact serialization"""
+        return np.rint(self.quality_score * 100).astype(np.int16)
+
+
+@lru_cache(maxsize=4096)
+def _power_budget(
+    optical_params: OpticalParameters,
+    loss_params: LossParameters,
+    segment: NetworkSegment
+) -> Tuple[float, float, float, float, float, float, float, int]:
+    """power_budget_kernel for one segment, memoized on the frozen (hashable) inputs"""
+    return power_budget_kernel(
+        optical_params.tx_power,
+        optical_params.rx_sensitivity,
+        loss_params.fiber_loss_per_km,
+        loss_params.splice_loss,
+        loss_params.connector_loss,
+        loss_params.safety_margin,
+        segment.fiber_length_km,
+        segment.splice_count,
+        segment.connector_count
+    )
+
+
+# Base recommendations for each status code, indexed like STATUS_LABELS
+_STATUS_RECOMMENDATIONS = (
+    (  # STATUS_CRITICAL
+        "⚠️ CRITICAL: Link margin is negative. Connection may fail.",
+        "➡️ Reduce fiber length or increase transmit power",
+        "➡️ Minimize splice and connector count",
+        "➡️ Use lower loss fiber (e.g., G.657.A2)"
+    ),
+    (  # STATUS_WARNING
+        "⚠️ WARNING: Link margin is below recommended threshold",
+        "➡️ Consider adding optical amplifiers for long distances",
+        "➡️ Ensure high-quality splices (< 0.05 dB)",
+        "➡️ Regular maintenance to prevent degradation"
+    ),
+    (  # STATUS_OK
+        "✅ Link quality is good",
+    )
+)
 
 
 class OPMCalculator:
@@ -74,6 +260,9 @@ class OPMCalculator:
         WavelengthType.NM_1550: 0.35,  # dB/km
     }
     
+    # Segments computed per vector pass in iter_analyze_multiple_segments
+    ANALYZE_CHUNK_SIZE = 4096
+    
     def __init__(self):
         """Initialize OPM Calculator"""
         pass
@@ -93,6 +282,9 @@ class OPMCalculator:
                        (Connector Count × Connector Loss)
         - Available Margin = Power Budget - Total Loss - Safety Margin
         
+        The numbers for a given (optical_params, loss_params, segment) are
+        memoized, so repeated what-if queries skip the computation.
+        
         Args:
             optical_params: Optical transmission parameters
             loss_params: Loss calculation parameters
@@ -101,67 +293,35 @@ class OPMCalculator:
         Returns:
             CalculationResult with complete analysis
         """
-        try:
-            # Calculate power budget
-            power_budget = optical_params.tx_power - optical_params.rx_sensitivity
-            
-            # Calculate individual losses
-            fiber_loss = segment.fiber_length_km * loss_params.fiber_loss_per_km
-            splice_loss = segment.splice_count * loss_params.splice_loss
-            connector_loss = segment.connector_count * loss_params.connector_loss
-            total_loss = fiber_loss + splice_loss + connector_loss
-            
-            # Calculate available margin
-            available_margin = power_budget - total_loss - loss_params.safety_margin
-            
-            # Determine status
-            status = self._determine_status(available_margin)
-            
-            # Calculate quality score (0-100)
-            quality_score = self._calculate_quality_score(
-                power_budget, total_loss, available_margin
-            )
-            
-            # Prepare detailed results
-            details = {
-                'segment_name': segment.name,
-                'optical_params': {
-                    'tx_power_dbm': optical_params.tx_power,
-                    'rx_sensitivity_dbm': optical_params.rx_sensitivity,
-                    'wavelength': optical_params.wavelength.value,
-                    'fiber_type': optical_params.fiber_type.value
-                },
-                'loss_breakdown': {
-                    'fiber_loss_db': round(fiber_loss, 2),
-                    'splice_loss_db': round(splice_loss, 2),
-                    'connector_loss_db': round(connector_loss, 2),
-                    'total_loss_db': round(total_loss, 2)
-                },
-                'segment_details': {
-                    'fiber_length_km': segment.fiber_length_km,
-                    'fiber_length_m': segment.fiber_length_km * 1000,
-                    'splice_count': segment.splice_count,
-                    'connector_count': segment.connector_count
-                },
-                'safety_margin_db': loss_params.safety_margin,
-                'loss_per_km_db': loss_params.fiber_loss_per_km
-            }
-            
-            result = CalculationResult(
-                power_budget=round(power_budget, 2),
-                total_loss=round(total_loss, 2),
-                available_margin=round(available_margin, 2),
-                status=status,
-                quality_score=round(quality_score, 2),
-                details=details
-            )
-            
-            logger.info(f"Calculated OPM for {segment.name}: Status={status}, Quality={quality_score:.2f}")
-            return result
-            
-        except Exception as e:
-            logger.error(f"Error in OPM calculation: {e}")
-            raise
+        (
+            power_budget,
+            fiber_loss,
+            splice_loss,
+            connector_loss,
+            total_loss,
+            available_margin,
+            quality_score,
+            status_code
+        ) = _power_budget(optical_params, loss_params, segment)
+        status = STATUS_LABELS[status_code]
+        
+        result = CalculationResult(
+            power_budget=power_budget,
+            total_loss=total_loss,
+            available_margin=available_margin,
+            status=status,
+            status_code=status_code,
+            quality_score=quality_score,
+            optical_params=optical_params,
+            loss_params=loss_params,
+            segment=segment,
+            fiber_loss=fiber_loss,
+            splice_loss=splice_loss,
+            connector_loss=connector_loss
+        )
+        
+        logger.info("Calculated OPM for %s: Status=%s, Quality=%.2f", segment.name, status, quality_score)
+        return result
     
     def calculate_max_distance(
         self,
@@ -173,6 +333,11 @@ class OPMCalculator:
         """
         Calculate maximum allowable fiber distance
         
+        Formula (closed form, no iteration):
+        - Max Distance = (Power Budget - Splice Count × Splice Loss -
+                          Connector Count × Connector Loss - Safety Margin) / Fiber Loss
+        - Clamped at 0 km when fixed losses exceed the budget
+        
         Args:
             optical_params: Optical parameters
             loss_params: Loss parameters
@@ -182,20 +347,16 @@ class OPMCalculator:
         Returns:
             Maximum distance in kilometers
         """
-        power_budget = optical_params.tx_power - optical_params.rx_sensitivity
-        
-        # Subtract fixed losses and safety margin
-        available_for_fiber = (
-            power_budget 
-            - (splice_count * loss_params.splice_loss)
-            - (connector_count * loss_params.connector_loss)
-            - loss_params.safety_margin
+        return max_distance_kernel(
+            optical_params.tx_power,
+            optical_params.rx_sensitivity,
+            loss_params.fiber_loss_per_km,
+            loss_params.splice_loss,
+            loss_params.connector_loss,
+            loss_params.safety_margin,
+            splice_count,
+            connector_count
         )
-        
-        # Calculate max distance
-        max_distance_km = available_for_fiber / loss_params.fiber_loss_per_km
-        
-        return max(0, max_distance_km)
     
     def calculate_required_tx_power(
         self,
@@ -225,6 +386,66 @@ class OPMCalculator:
         
         return round(required_tx, 2)
     
+    def calculate_max_distance_grid(
+        self,
+        tx_power: np.ndarray,
+        rx_sensitivity: np.ndarray,
+        splice_counts: np.ndarray,
+        connector_counts: np.ndarray,
+        fiber_loss_per_km: np.ndarray,
+        splice_loss: np.ndarray,
+        connector_loss: np.ndarray,
+        safety_margin: np.ndarray
+    ) -> np.ndarray:
+        """
+        calculate_max_distance over a parameter grid in one vector pass
+        
+        Every argument may be a scalar or an array; they are broadcast
+        together, e.g. tx_power[:, None] with splice_counts[None, :] gives a
+        Tx power × splice count table.
+        
+        Returns:
+            Maximum distance in kilometers, in the broadcast shape
+        """
+        power_budget = np.subtract(tx_power, rx_sensitivity, dtype=np.float64)
+        available_for_fiber = (
+            power_budget
+            - np.multiply(splice_counts, splice_loss)
+            - np.multiply(connector_counts, connector_loss)
+            - safety_margin
+        )
+        return np.maximum(0.0, available_for_fiber / fiber_loss_per_km)
+    
+    def calculate_required_tx_power_batch(
+        self,
+        rx_sensitivity: float,
+        lengths_km: np.ndarray,
+        splice_counts: np.ndarray,
+        connector_counts: np.ndarray,
+        loss_params: LossParameters
+    ) -> np.ndarray:
+        """
+        calculate_required_tx_power for many segments in one vector pass
+        
+        Values are not rounded.
+        
+        Args:
+            rx_sensitivity: Receiver sensitivity (dBm)
+            lengths_km: Fiber length of each segment (km)
+            splice_counts: Splice count of each segment
+            connector_counts: Connector count of each segment
+            loss_params: Loss parameters
+            
+        Returns:
+            Required Tx power (dBm) of each segment
+        """
+        total_loss = (
+            np.multiply(lengths_km, loss_params.fiber_loss_per_km, dtype=np.float64)
+            + np.multiply(splice_counts, loss_params.splice_loss)
+            + np.multiply(connector_counts, loss_params.connector_loss)
+        )
+        return rx_sensitivity + total_loss + loss_params.safety_margin
+    
     def analyze_multiple_segments(
         self,
         optical_params: OpticalParameters,
@@ -242,53 +463,206 @@ class OPMCalculator:
         Returns:
             List of calculation results
         """
-        results = []
-        for segment in segments:
-            result = self.calculate_power_budget(optical_params, loss_params, segment)
-            results.append(result)
-        return results
+        return list(self.iter_analyze_multiple_segments(optical_params, loss_params, segments))
     
-    def _determine_status(self, available_margin: float) -> str:
+    def iter_analyze_multiple_segments(
+        self,
+        optical_params: OpticalParameters,
+        loss_params: LossParameters,
+        segments: List[NetworkSegment],
+        chunk_size: Optional[int] = None
+    ) -> Iterator[CalculationResult]:
         """
-        Determine link status based on available margin
+        Analyze multiple network segments, yielding one result at a time
         
-        Criteria:
-        - OK: margin >= 3 dB
-        - Warning: 0 dB <= margin < 3 dB
-        - Critical: margin < 0 dB
+        Segments are transposed into arrays and computed with
+        calculate_power_budget_batch one chunk at a time, so only one chunk of
+        arrays is alive at once; results equal calling calculate_power_budget
+        on each segment.
+        
+        Args:
+            optical_params: Optical parameters
+            loss_params: Loss parameters
+            segments: List of network segments
+            chunk_size: Segments per vector pass (default ANALYZE_CHUNK_SIZE)
+            
+        Yields:
+            Calculation result for each segment, in order
         """
-        if available_margin >= 3.0:
-            return "OK"
-        elif available_margin >= 0:
-            return "Warning"
-        else:
-            return "Critical"
+        chunk_size = chunk_size or self.ANALYZE_CHUNK_SIZE
+        status_counts = np.zeros(3, dtype=np.int64)
+        
+        for start in range(0, len(segments), chunk_size):
+            chunk = segments[start:start + chunk_size]
+            lengths_km, splice_counts, connector_counts, _ = NetworkSegment.stack(chunk)
+            
+            batch = self.calculate_power_budget_batch(
+                optical_params, loss_params, lengths_km, splice_counts, connector_counts
+            )
+            status_counts += np.bincount(batch.status_code, minlength=3)
+            
+            for segment, fiber_loss, splice_loss, connector_loss, total_loss, margin, status_code, quality in zip(
+                chunk,
+                batch.fiber_loss.tolist(),
+                batch.splice_loss.tolist(),
+                batch.connector_loss.tolist(),
+                batch.total_loss.tolist(),
+                batch.available_margin.tolist(),
+                batch.status_code.tolist(),
+                batch.quality_score.tolist()
+            ):
+                yield CalculationResult(
+                    power_budget=batch.power_budget,
+                    total_loss=total_loss,
+                    available_margin=margin,
+                    status=STATUS_LABELS[status_code],
+                    status_code=status_code,
+                    quality_score=quality,
+                    optical_params=optical_params,
+                    loss_params=loss_params,
+                    segment=segment,
+                    fiber_loss=fiber_loss,
+                    splice_loss=splice_loss,
+                    connector_loss=connector_loss
+                )
+        
+        # One summary line instead of one per segment
+        if logger.isEnabledFor(logging.INFO):
+            ok_count, warning_count, critical_count = (
+                status_counts[[STATUS_OK, STATUS_WARNING, STATUS_CRITICAL]].tolist()
+            )
+            logger.info(
+                "Calculated OPM for %s segments: %s OK / %s Warning / %s Critical",
+                len(segments), ok_count, warning_count, critical_count
+            )
     
-    def _calculate_quality_score(
+    def calculate_power_budget_batch(
         self,
-        power_budget: float,
-        total_loss: float,
-        available_margin: float
-    ) -> float:
+        optical_params: OpticalParameters,
+        loss_params: LossParameters,
+        lengths_km: np.ndarray,
+        splice_counts: np.ndarray,
+        connector_counts: np.ndarray
+    ) -> BatchCalculationResult:
         """
-        Calculate quality score (0-100)
+        Calculate power budget analysis for many segments in one vector pass
+        
+        Uses the same formulas as calculate_power_budget, applied to whole
+        arrays instead of one segment at a time: a parallel compiled loop when
+        Numba is installed, NumPy array operations otherwise. Values are not
+        rounded.
         
-        Based on:
-        - Loss efficiency: (1 - total_loss/power_budget) × 40
-        - Margin adequacy: (available_margin/10) × 60
+        Args:
+            optical_params: Optical transmission parameters
+            loss_params: Loss calculation parameters
+            lengths_km: Fiber length of each segment (km)
+            splice_counts: Splice count of each segment
+            connector_counts: Connector count of each segment
+            
+        Returns:
+            BatchCalculationResult with one array entry per segment
         """
-        if power_budget <= 0:
-            return 0.0
+        power_budget = optical_params.tx_power - optical_params.rx_sensitivity
+        
+        if NUMBA_AVAILABLE:
+            # Compiled parallel loop over segments
+            (
+                fiber_loss,
+                splice_loss,
+                connector_loss,
+                total_loss,
+                available_margin,
+                quality_score,
+                status_code
+            ) = power_budget_batch_kernel(
+                optical_params.tx_power,
+                optical_params.rx_sensitivity,
+                loss_params.fiber_loss_per_km,
+                loss_params.splice_loss,
+                loss_params.connector_loss,
+                loss_params.safety_margin,
+                np.ascontiguousarray(lengths_km, dtype=np.float64),
+                np.ascontiguousarray(splice_counts, dtype=np.int64),
+                np.ascontiguousarray(connector_counts, dtype=np.int64)
+            )
+        else:
+            fiber_loss = lengths_km * loss_params.fiber_loss_per_km
+            splice_loss = splice_counts * loss_params.splice_loss
+            connector_loss = connector_counts * loss_params.connector_loss
+            total_loss = fiber_loss + splice_loss + connector_loss
+            
+            available_margin = power_budget - total_loss - loss_params.safety_margin
+            
+            # Branchless: 0 (Critical) + 1 if margin >= 0 dB + 1 if margin >= 3 dB
+            status_code = (available_margin >= 0.0).view(np.int8) + (available_margin >= 3.0).view(np.int8)
+            
+            if power_budget <= 0:
+                quality_score = np.zeros_like(total_loss)
+            else:
+                # Same operations as the scalar kernel, reusing two buffers
+                quality_score = total_loss / power_budget
+                np.subtract(1.0, quality_score, out=quality_score)
+                np.maximum(quality_score, 0.0, out=quality_score)
+                quality_score *= 40.0  # loss efficiency (0-40)
+                margin_adequacy = available_margin / 10.0
+                margin_adequacy *= 60.0
+                np.clip(margin_adequacy, 0.0, 60.0, out=margin_adequacy)  # (0-60)
+                quality_score += margin_adequacy
+                np.clip(quality_score, 0.0, 100.0, out=quality_score)
+        
+        status = np.array(STATUS_LABELS)[status_code]
         
-        # Loss efficiency score (0-40)
-        loss_efficiency = max(0, (1 - total_loss / power_budget)) * 40
+        return BatchCalculationResult(
+            power_budget=power_budget,
+            fiber_loss=fiber_loss,
+            splice_loss=splice_loss,
+            connector_loss=connector_loss,
+            total_loss=total_loss,
+            available_margin=available_margin,
+            status_code=status_code,
+            status=status,
+            quality_score=quality_score
+        )
+    
+    @staticmethod
+    def build_details(
+        optical_params: OpticalParameters,
+        loss_params: LossParameters,
+        segment_name: str,
+        fiber_length_km: float,
+        splice_count: int,
+        connector_count: int,
+        fiber_loss: float,
+        splice_loss: float,
+        connector_loss: float,
+        total_loss: float
+    ) -> OPMDetails:
+        """
+        Build the detailed result for one segment
         
-        # Margin adequacy score (0-60)
-        # Ideal margin is 10 dB or more
-        margin_adequacy = min(60, max(0, (available_margin / 10) * 60))
+        Shared by CalculationResult.details and callers that compute segments
+        with calculate_power_budget_batch. Loss values are kept at full
+        precision; OPMDetails.to_dict rounds them for the response.
         
-        total_score = loss_efficiency + margin_adequacy
-        return max(0, min(100, total_score))
+        Returns:
+            OPMDetails as returned by CalculationResult.details
+        """
+        return OPMDetails(
+            segment_name=segment_name,
+            tx_power_dbm=optical_params.tx_power,
+            rx_sensitivity_dbm=optical_params.rx_sensitivity,
+            wavelength=optical_params.wavelength.value,
+            fiber_type=optical_params.fiber_type.value,
+            fiber_loss_db=fiber_loss,
+            splice_loss_db=splice_loss,
+            connector_loss_db=connector_loss,
+            total_loss_db=total_loss,
+            fiber_length_km=fiber_length_km,
+            splice_count=splice_count,
+            connector_count=connector_count,
+            safety_margin_db=loss_params.safety_margin,
+            loss_per_km_db=loss_params.fiber_loss_per_km
+        )
     
     def get_recommendations(self, result: CalculationResult) -> List[str]:
         """
@@ -300,42 +674,75 @@ class OPMCalculator:
         Returns:
             List of recommendation strings
         """
-        recommendations = []
+        # Thresholds apply to the values as reported (rounded to 2 decimals)
+        return self.build_recommendations(
+            result.status_code,
+            round(result.fiber_loss, 2),
+            round(result.splice_loss, 2),
+            round(result.quality_score, 2)
+        )
+    
+    def build_recommendations(
+        self,
+        status_code: int,
+        fiber_loss: float,
+        splice_loss: float,
+        quality_score: float
+    ) -> List[str]:
+        """
+        Get recommendations from the raw values of a calculation
         
-        if result.status == "Critical":
-            recommendations.append("⚠️ CRITICAL: Link margin is negative. Connection may fail.")
-            recommendations.append("➡️ Reduce fiber length or increase transmit power")
-            recommendations.append("➡️ Minimize splice and connector count")
-            recommendations.append("➡️ Use lower loss fiber (e.g., G.657.A2)")
-            
-        elif result.status == "Warning":
-            recommendations.append("⚠️ WARNING: Link margin is below recommended threshold")
-            recommendations.append("➡️ Consider adding optical amplifiers for long distances")
-            recommendations.append("➡️ Ensure high-quality splices (< 0.05 dB)")
-            recommendations.append("➡️ Regular maintenance to prevent degradation")
-            
-        else:  # OK
-            recommendations.append("✅ Link quality is good")
+        Args:
+            status_code: Link status code (STATUS_CRITICAL, STATUS_WARNING or STATUS_OK)
+            fiber_loss: Fiber loss (dB)
+            splice_loss: Splice loss (dB)
+            quality_score: Quality score (0-100)
             
-        # Additional recommendations based on details
-        details = result.details
-        fiber_loss = details['loss_breakdown']['fiber_loss_db']
-        splice_loss = details['loss_breakdown']['splice_loss_db']
+        Returns:
+            List of recommendation strings
+        """
+        recommendations = list(_STATUS_RECOMMENDATIONS[status_code])
         
+        # Additional recommendations based on loss breakdown
         if splice_loss > fiber_loss * 0.3:
             recommendations.append("➡️ Splice loss is significant. Consider reducing splice count")
         
-        if result.quality_score < 70:
+        if quality_score < 70:
             recommendations.append("➡️ Consider route optimization to improve quality score")
         
         return recommendations
 
 
+@lru_cache(maxsize=64)
+def make_margin_calculator(loss_params: LossParameters) -> Callable[[float, float, float, int, int], float]:
+    """
+    Available-margin function specialized for one set of loss parameters
+    
+    The four coefficients are bound as closure constants, so evaluating
+    many segments with the same LossParameters does no attribute lookups.
+    Same formula and operation order as calculate_power_budget.
+    
+    Returns:
+        margin(tx_power, rx_sensitivity, length_km, splice_count, connector_count) in dB
+    """
+    fiber_loss_per_km = loss_params.fiber_loss_per_km
+    splice_loss = loss_params.splice_loss
+    connector_loss = loss_params.connector_loss
+    safety_margin = loss_params.safety_margin
+    
+    def margin(tx_power: float, rx_sensitivity: float, length_km: float, splice_count: int, connector_count: int) -> float:
+        total_loss = length_km * fiber_loss_per_km + splice_count * splice_loss + connector_count * connector_loss
+        return (tx_power - rx_sensitivity) - total_loss - safety_margin
+    
+    return margin
+
+
 # Helper functions for common calculations
 
 def db_to_linear(db_value: float) -> float:
     """Convert dB to linear scale"""
-    return 10 ** (db_value / 10)
+    # Float base skips the int-to-float conversion of the generic power path
+    return 10.0 ** (db_value / 10)
 
 
 def linear_to_db(linear_value: float) -> float:
@@ -347,7 +754,7 @@ def linear_to_db(linear_value: float) -> float:
 
 def dbm_to_mw(dbm_value: float) -> float:
     """Convert dBm to milliwatts"""
-    return 10 ** (dbm_value / 10)
+    return 10.0 ** (dbm_value / 10)
 
 
 def mw_to_dbm(mw_value: float) -> float:
@@ -355,3 +762,17 @@ def mw_to_dbm(mw_value: float) -> float:
     if mw_value <= 0:
         return float('-inf')
     return 10 * math.log10(mw_value)
+
+
+def db_to_linear_array(db_values: np.ndarray) -> np.ndarray:
+    """Convert an array of dB values to linear scale (also dBm to milliwatts)"""
+    return np.power(10.0, np.asarray(db_values, dtype=np.float64) / 10)
+
+
+def linear_to_db_array(linear_values: np.ndarray) -> np.ndarray:
+    """Convert an array of linear values to dB (also milliwatts to dBm); values <= 0 become -inf"""
+    linear_values = np.asarray(linear_values, dtype=np.float64)
+    positive = linear_values > 0
+    db_values = np.full(linear_values.shape, -np.inf)
+    db_values[positive] = 10 * np.log10(linear_values[positive])
+    return db_values
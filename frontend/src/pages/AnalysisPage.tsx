@@ -26,6 +26,7 @@ import {
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, BarChart, Bar } from 'recharts'
 import axios from 'axios'
 import { useNetworkStore } from '../stores/networkStore'
+import { apiErrorMessage } from '../utils/apiError'
 
 const AnalysisPage = () => {
   const { opmAnalysis, statistics, projectName } = useNetworkStore()
@@ -96,7 +97,7 @@ const AnalysisPage = () => {
 
       setResult(response.data)
     } catch (err: any) {
-      setError(err.response?.data?.detail || 'Analysis failed')
+      setError(apiErrorMessage(err, 'Analysis failed'))
     } finally {
       setLoading(false)
     }
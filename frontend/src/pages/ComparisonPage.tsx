@@ -29,6 +29,7 @@ import CheckCircleIcon from '@mui/icons-material/CheckCircle'
 import WarningIcon from '@mui/icons-material/Warning'
 import ErrorIcon from '@mui/icons-material/Error'
 import axios from 'axios'
+import { apiErrorMessage } from '../utils/apiError'
 
 const ComparisonPage = () => {
   const [activeStep, setActiveStep] = useState(0)
@@ -109,7 +110,7 @@ const ComparisonPage = () => {
       await axios.post('/api/comparison/upload-asplanned', formData)
       setActiveStep(2)
     } catch (err: any) {
-      setError(err.response?.data?.detail || 'Upload failed')
+      setError(apiErrorMessage(err, 'Upload failed'))
     } finally {
       setUploading(false)
     }
@@ -140,7 +141,7 @@ const ComparisonPage = () => {
       setActiveStep(3)
       handleCompare()
     } catch (err: any) {
-      setError(err.response?.data?.detail || 'Upload failed')
+      setError(apiErrorMessage(err, 'Upload failed'))
     } finally {
       setUploading(false)
     }
@@ -157,7 +158,7 @@ const ComparisonPage = () => {
       const response = await axios.post('/api/comparison/compare', formData)
       setComparisonResult(response.data)
     } catch (err: any) {
-      setError(err.response?.data?.detail || 'Comparison failed')
+      setError(apiErrorMessage(err, 'Comparison failed'))
     } finally {
       setComparing(false)
     }
@@ -14,7 +14,8 @@ import {
 import { useDropzone } from 'react-dropzone'
 import CloudUploadIcon from '@mui/icons-material/CloudUpload'
 import axios from 'axios'
-import { useNetworkStore } from '../stores/networkStore'
+import { networkDataFromColumns, useNetworkStore } from '../stores/networkStore'
+import { apiErrorMessage } from '../utils/apiError'
 
 const UploadPage = () => {
   const navigate = useNavigate()
@@ -48,14 +49,14 @@ const UploadPage = () => {
       // Save to store for map view
       if (response.data.data) {
         setNetworkData(
-          response.data.data,
+          networkDataFromColumns(response.data.data),
           response.data.project_name,
           response.data.statistics,
           response.data.opm_analysis
         )
       }
     } catch (err: any) {
-      setError(err.response?.data?.detail || 'Upload failed')
+      setError(apiErrorMessage(err, 'Upload failed'))
     } finally {
       setUploading(false)
     }
@@ -39,6 +39,79 @@ interface NetworkData {
   cables: Cable[]
 }
 
+// Column-wise network data as returned by /api/upload/kml
+interface CoordinateColumns {
+  longitude: number[]
+  latitude: number[]
+  altitude: number[]
+}
+
+export interface NetworkDataColumns {
+  poles: {
+    name: string[]
+    designator: string[]
+    construction_status: string[]
+    material_type: string[]
+    usage: string[]
+    coordinates: CoordinateColumns
+  }
+  odps: {
+    name: string[]
+    specification: string[]
+    splice_type: string[]
+    construction_status: string[]
+    coordinates: CoordinateColumns
+  }
+  cables: {
+    name: string[]
+    specification: string[]
+    number_of_cores: number[]
+    fiber_length_m: number[]
+    fiber_length_km: number[]
+    construction_status: string[]
+    coordinates: CoordinateColumns[]
+  }
+}
+
+const toCoordinates = (columns: CoordinateColumns): Coordinate[] =>
+  columns.longitude.map((longitude, i) => ({
+    longitude,
+    latitude: columns.latitude[i],
+    altitude: columns.altitude[i]
+  }))
+
+// Rebuild per-entity objects from the column-wise upload response
+export const networkDataFromColumns = ({ poles, odps, cables }: NetworkDataColumns): NetworkData => {
+  const poleCoordinates = toCoordinates(poles.coordinates)
+  const odpCoordinates = toCoordinates(odps.coordinates)
+  return {
+    poles: poles.name.map((name, i) => ({
+      name,
+      designator: poles.designator[i],
+      construction_status: poles.construction_status[i],
+      material_type: poles.material_type[i],
+      usage: poles.usage[i],
+      coordinates: poleCoordinates[i]
+    })),
+    odps: odps.name.map((name, i) => ({
+      name,
+      specification: odps.specification[i],
+      splice_type: odps.splice_type[i],
+      construction_status: odps.construction_status[i],
+      coordinates: odpCoordinates[i]
+    })),
+    cables: cables.name.map((name, i) => ({
+      name,
+      specification: cables.specification[i],
+      number_of_cores: cables.number_of_cores[i],
+      fiber_length_m: cables.fiber_length_m[i],
+      fiber_length_km: cables.fiber_length_km[i],
+      construction_status: cables.construction_status[i],
+      coordinates: toCoordinates(cables.coordinates[i])
+    }))
+  }
+}
+
 interface OPMResult {
   cable_name: string
   power_budget_db: number
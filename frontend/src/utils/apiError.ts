@@ -0,0 +1,11 @@
+/**
+ * Extract a displayable message from an API error response.
+ * `detail` is a string for client errors and `{ error, type }` for server errors.
+ */
+export function apiErrorMessage(err: any, fallback: string): string {
+  const detail = err.response?.data?.detail
+  if (typeof detail === 'string') {
+    return detail
+  }
+  return detail?.error || fallback
+}